@@ -1,18 +1,32 @@
 #!/usr/bin/env python3
 import os
-import subprocess
 import sys
+import asyncio
+from collections import deque
 
-def test_script(script_path, *args):
+# Number of trailing stdout lines kept and printed after the script exits
+STDOUT_TAIL_LINES = 200
+
+async def _drain_stdout(stream, tail):
+    """Keep only the last lines of stdout so memory stays bounded."""
+    async for line in stream:
+        tail.append(line.decode(errors='replace'))
+
+async def _stream_stderr(stream):
+    """Print stderr line by line as the script produces it."""
+    async for line in stream:
+        print(f"STDERR: {line.decode(errors='replace')}", end='')
+
+async def test_script_async(script_path, *args):
     """Test if a script can be executed with the given arguments."""
     print(f"Testing script: {script_path}")
     print(f"Arguments: {args}")
-    
+
     # Check if script exists
     if not os.path.exists(script_path):
         print(f"ERROR: Script not found at {script_path}")
         return False
-    
+
     # Check if script is executable
     if not os.access(script_path, os.X_OK):
         print(f"WARNING: Script is not executable. Trying to fix...")
@@ -22,43 +36,59 @@ def test_script(script_path, *args):
         except Exception as e:
             print(f"ERROR: Could not set executable permission: {e}")
             return False
-    
-    # Try to execute the script
+
+    # Try to execute the script, reading both pipes concurrently so neither can fill up
+    process = None
     try:
         print(f"Executing: {script_path} {' '.join(args)}")
-        result = subprocess.run([script_path] + list(args), 
-                               stdout=subprocess.PIPE, 
-                               stderr=subprocess.PIPE,
-                               text=True,
-                               check=False)
-        
-        print(f"Return code: {result.returncode}")
-        
-        if result.stdout:
-            print("STDOUT:")
-            print(result.stdout)
-        
-        if result.stderr:
-            print("STDERR:")
-            print(result.stderr)
-        
-        return result.returncode == 0
+        process = await asyncio.create_subprocess_exec(
+            script_path, *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=1024 * 1024, # Allow long log lines
+        )
+        stdout_tail = deque(maxlen=STDOUT_TAIL_LINES)
+        await asyncio.gather(
+            _drain_stdout(process.stdout, stdout_tail),
+            _stream_stderr(process.stderr),
+        )
+        returncode = await process.wait()
+
+        print(f"Return code: {returncode}")
+
+        if stdout_tail:
+            print(f"STDOUT (last {len(stdout_tail)} lines):")
+            print(''.join(stdout_tail), end='')
+
+        return returncode == 0
     except Exception as e:
         print(f"ERROR: Exception during execution: {e}")
+        # e.g. a line over the read limit; don't leave the script running
+        if process is not None and process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
         return False
 
+def test_script(script_path, *args):
+    """Synchronous wrapper around test_script_async."""
+    return asyncio.run(test_script_async(script_path, *args))
+
 if __name__ == "__main__":
     script_path = "/Users/steinbockbarite/Documents/GitHub/LlamaCagUI/scripts/bash/create_kv_cache.sh"
     model_path = "/Users/steinbockbarite/Documents/llama.cpp/models/google_gemma-3-4b-it-Q4_K_M.gguf"
     doc_path = "/tmp/test_document.txt"
-    
+
     # Create test document if it doesn't exist
     if not os.path.exists(doc_path):
         with open(doc_path, 'w') as f:
             f.write("This is a test document for KV cache testing.")
-    
+
     success = test_script(script_path, model_path, doc_path, "test_cache")
-    
+
     if success:
         print("\nScript executed successfully!")
     else:
@@ -4,10 +4,19 @@ Diagnostic and repair tool for LlamaCag UI
 """
 
 import os
+import re
 import sys
 import shutil
 import json
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# How much of a file check_file inspects; plenty to find imports and class definitions
+HEADER_READ_BYTES = 64 * 1024
+
+# Anything that looks like Python source; one pass instead of several substring scans
+_PY_SIG = re.compile(rb'\b(?:import|def |class )')
+_CLASS_RE_CACHE = {}
 
 def check_file(path, repair=False):
     """Check if a file exists and has content"""
@@ -15,11 +24,14 @@ def check_file(path, repair=False):
     
     print(f"Checking {file_path}...")
     
-    if not file_path.exists():
+    # One stat covers both the existence and the empty-file checks
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
         print(f"  ERROR: File does not exist!")
         return False
     
-    if file_path.stat().st_size == 0:
+    if st.st_size == 0:
         print(f"  ERROR: File is empty!")
         if repair:
             print(f"  Creating backup of empty file...")
@@ -27,39 +39,44 @@ def check_file(path, repair=False):
             shutil.copy2(file_path, backup_path)
         return False
     
-    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-        try:
-            content = f.read()
-            if len(content.strip()) == 0:
-                print(f"  ERROR: File has only whitespace!")
+    try:
+        # The heuristics below only need the start of the file
+        with open(file_path, 'rb') as f:
+            head = f.read(HEADER_READ_BYTES)
+        if len(head.strip()) == 0:
+            print(f"  ERROR: File has only whitespace!")
+            return False
+        
+        # Very basic check for Python files to see if they look legitimate
+        if path.endswith('.py'):
+            if not _PY_SIG.search(head):
+                print(f"  WARNING: File doesn't look like valid Python code!")
                 return False
             
-            # Very basic check for Python files to see if they look legitimate
-            if path.endswith('.py'):
-                if 'import' not in content and 'def ' not in content and 'class ' not in content:
-                    print(f"  WARNING: File doesn't look like valid Python code!")
-                    return False
+            # Specific check for class names in UI files
+            if '/ui/' in path and not path.endswith('__init__.py'):
+                filename = os.path.basename(path)
+                base_name = os.path.splitext(filename)[0]
+                expected_class = ''.join(word.capitalize() for word in base_name.split('_'))
                 
-                # Specific check for class names in UI files
-                if '/ui/' in path and not path.endswith('__init__.py'):
-                    filename = os.path.basename(path)
-                    base_name = os.path.splitext(filename)[0]
-                    expected_class = ''.join(word.capitalize() for word in base_name.split('_'))
-                    
-                    if f"class {expected_class}" not in content:
-                        print(f"  ERROR: Expected class '{expected_class}' not found in {filename}!")
-                        return False
-            
-            print(f"  OK: File exists and has content")
-            return True
-            
-        except Exception as e:
-            print(f"  ERROR: Could not read file: {e}")
-            return False
+                class_re = _CLASS_RE_CACHE.get(expected_class)
+                if class_re is None:
+                    class_re = re.compile(rf'class {re.escape(expected_class)}\b'.encode())
+                    _CLASS_RE_CACHE[expected_class] = class_re
+                
+                if not class_re.search(head):
+                    print(f"  ERROR: Expected class '{expected_class}' not found in {filename}!")
+                    return False
+        
+        print(f"  OK: File exists and has content")
+        return True
+        
+    except Exception as e:
+        print(f"  ERROR: Could not read file: {e}")
+        return False
 
-def create_minimal_chat_tab(path):
-    """Create a minimal chat_tab.py file"""
-    content = '''#!/usr/bin/env python3
+# Replacement sources written by the repair functions
+MINIMAL_CHAT_TAB_SOURCE = '''#!/usr/bin/env python3
 """
 Chat tab for LlamaCag UI
 
@@ -141,23 +158,8 @@ class ChatTab(QWidget):
         """Handle KV cache selection from CacheTab"""
         pass
 '''
-    
-    # Create a backup if the file exists
-    if os.path.exists(path):
-        backup_path = path + '.backup'
-        print(f"Creating backup of existing chat_tab.py to {backup_path}")
-        shutil.copy2(path, backup_path)
-    
-    # Write the minimal version
-    with open(path, 'w', encoding='utf-8') as f:
-        f.write(content)
-    
-    print(f"Created minimal chat_tab.py at {path}")
-    return True
 
-def create_minimal_cache_manager(path):
-    """Create a minimal cache_manager.py file"""
-    content = '''#!/usr/bin/env python3
+MINIMAL_CACHE_MANAGER_SOURCE = '''#!/usr/bin/env python3
 """
 Ultra minimal KV cache management for LlamaCag UI
 A simplified version that avoids any recursion risk
@@ -166,9 +168,60 @@ import os
 import sys
 import json
 import time
+import atexit
+import contextlib
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
-from typing import Dict, List, Optional
-from PyQt5.QtCore import QObject, pyqtSignal
+from typing import Dict, FrozenSet, List, Optional
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+# Try to import orjson for faster registry load/save if available
+try:
+    import orjson
+    HAVE_ORJSON = True
+except ImportError:
+    HAVE_ORJSON = False
+
+# Delay before pending registry changes are written to disk
+FLUSH_DELAY_MS = 500
+
+# Values for fields missing from a registry or usage entry
+_CACHE_DEFAULTS = {
+    'original_file_path': '',
+    'context_size': 0,
+    'token_count': 0,
+    'model_id': '',
+    'created_at': None,
+    'is_master': False,
+    'last_used': None,
+    'usage_count': 0,
+}
+
+@lru_cache(maxsize=8)
+def _resolve_cache_dir(setting):
+    """Expand the configured cache directory, defaulting to ~/cag_project/kv_caches"""
+    return os.path.expanduser(setting or os.path.join('~', 'cag_project', 'kv_caches'))
+
+@lru_cache(maxsize=4096)
+def _path_parts(path):
+    """Filename and extension-less stem of a cache path, computed once per path"""
+    filename = os.path.basename(path)
+    return filename, os.path.splitext(filename)[0]
+
+_EMPTY_JSON = b"{}"
+
+def _write_empty_json(path):
+    """Create an empty JSON file unless one already exists (checked by the kernel via O_EXCL)"""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return False
+    try:
+        os.write(fd, _EMPTY_JSON)
+    finally:
+        os.close(fd)
+    return True
 
 class CacheManager(QObject):
     """Minimal manager for KV caches with no directory traversal"""
@@ -182,64 +235,150 @@ class CacheManager(QObject):
         self.config = config
         
         # Use a simple string path to avoid any Path object issues
-        cache_dir = config.get('LLAMACPP_KV_CACHE_DIR', '')
-        if not cache_dir:
-            cache_dir = os.path.join(os.path.expanduser('~'), 'cag_project', 'kv_caches')
-        self.kv_cache_dir = os.path.expanduser(cache_dir)
-        
-        # Create directory if it doesn't exist
-        if not os.path.exists(self.kv_cache_dir):
-            os.makedirs(self.kv_cache_dir, exist_ok=True)
-        
-        # Registry paths
-        self.registry_path = os.path.join(self.kv_cache_dir, 'cache_registry.json')
-        self.usage_path = os.path.join(self.kv_cache_dir, 'usage_registry.json')
+        self._set_cache_dir(_resolve_cache_dir(config.get('LLAMACPP_KV_CACHE_DIR', '')))
         
         # Create empty registry files if they don't exist
-        if not os.path.exists(self.registry_path):
-            with open(self.registry_path, 'w') as f:
-                f.write("{}")
-        if not os.path.exists(self.usage_path):
-            with open(self.usage_path, 'w') as f:
-                f.write("{}")
+        _write_empty_json(self.registry_path)
+        _write_empty_json(self.usage_path)
         
         # Load registries
         self._cache_registry = self._load_json(self.registry_path, {})
         self._usage_registry = self._load_json(self.usage_path, {})
+        
+        # Registries are only written when they changed, on a short debounce
+        self._registry_dirty = False
+        self._usage_dirty = False
+        self._flush_pending = False
+        self._batch_depth = 0
+        atexit.register(self.flush)
+        
+        # Last directory listing, see _scan_dir_once
+        self._scan_snapshot = None
+    
+    def _set_cache_dir(self, cache_dir):
+        """Point the manager at a cache directory and derive its registry paths"""
+        self.kv_cache_dir = cache_dir
+        
+        # Create directory if it doesn't exist
+        os.makedirs(self.kv_cache_dir, exist_ok=True)
+        
+        # Registry paths
+        self.registry_path = os.path.join(self.kv_cache_dir, 'cache_registry.json')
+        self.usage_path = os.path.join(self.kv_cache_dir, 'usage_registry.json')
     
     def _load_json(self, path, default=None):
         """Safe JSON loading with fallback"""
         try:
-            with open(path, 'r') as f:
-                return json.load(f)
+            with open(path, 'rb') as f:
+                data = f.read()
+            if HAVE_ORJSON:
+                return orjson.loads(data)
+            return json.loads(data)
         except Exception as e:
             print(f"Failed to load {path}: {e}")
             return default if default is not None else {}
     
-    def _save_json(self, path, data):
-        """Safe JSON saving"""
+    def _save_json(self, path, data, pretty=False):
+        """Safe JSON saving (write to a temp file, then rename over the old one).
+        Registries are written compact unless pretty is set."""
+        tmp_path = path + '.tmp'
         try:
-            with open(path, 'w') as f:
-                json.dump(data, f, indent=2)
+            if HAVE_ORJSON:
+                payload = orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else None)
+            elif pretty:
+                payload = json.dumps(data, indent=2).encode('utf-8')
+            else:
+                payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
             return True
         except Exception as e:
             print(f"Failed to save {path}: {e}")
             return False
     
+    def _mark_dirty(self, registry=False, usage=False):
+        """Record which registries changed and schedule a flush"""
+        self._registry_dirty |= registry
+        self._usage_dirty |= usage
+        if not self._flush_pending and not self._batch_depth:
+            self._flush_pending = True
+            QTimer.singleShot(FLUSH_DELAY_MS, self.flush)
+    
+    @contextlib.contextmanager
+    def batch(self):
+        """Group several registry changes into one write when the outermost batch exits"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+    
+    def flush(self):
+        """Write any registries that changed since the last flush"""
+        self._flush_pending = False
+        if self._registry_dirty:
+            self._save_json(self.registry_path, self._cache_registry)
+            self._registry_dirty = False
+        if self._usage_dirty:
+            self._save_json(self.usage_path, self._usage_registry)
+            self._usage_dirty = False
+    
+    def _scan_dir_once(self) -> FrozenSet[str]:
+        """List the cache directory once (no recursion) as absolute paths.
+        The listing is reused until the directory's mtime changes. Only names are
+        kept: a file rewritten in place doesn't change the directory's mtime, so
+        sizes and times must come from a fresh stat."""
+        try:
+            dir_mtime = os.stat(self.kv_cache_dir).st_mtime_ns
+        except OSError as e:
+            print(f"Failed to scan {self.kv_cache_dir}: {e}")
+            return frozenset()
+        if self._scan_snapshot is not None and self._scan_snapshot[0] == (self.kv_cache_dir, dir_mtime):
+            return self._scan_snapshot[1]
+        
+        try:
+            with os.scandir(self.kv_cache_dir) as it:
+                entries = frozenset(os.path.abspath(entry.path) for entry in it)
+        except OSError as e:
+            print(f"Failed to scan {self.kv_cache_dir}: {e}")
+            return frozenset()
+        self._scan_snapshot = ((self.kv_cache_dir, dir_mtime), entries)
+        return entries
+    
+    def _build_cache_info(self, path, info, usage, stat) -> Dict:
+        """Merge registry and usage entries with file stats into one cache info dict"""
+        filename, stem = _path_parts(path)
+        cache_info = {**_CACHE_DEFAULTS, **info, **usage}
+        cache_info.update(
+            id=info.get('document_id', filename),
+            path=path,
+            filename=filename,
+            size=stat.st_size,
+            last_modified=stat.st_mtime,
+            document_id=info.get('document_id', stem),
+        )
+        return cache_info
+    
     def refresh_cache_list(self):
-        """Update registry by checking files - NO DIRECTORY SCANNING"""
-        print("Checking registry entries (NO DIRECTORY SCANNING)")
+        """Update registry by checking files - single listing, NO RECURSIVE SCANNING"""
+        print("Checking registry entries (NO RECURSIVE SCANNING)")
+        entries = self._scan_dir_once()
         
         # Remove entries for non-existent files
+        removed = False
         for path in list(self._cache_registry.keys()):
-            if not os.path.exists(path):
+            if os.path.abspath(path) not in entries and not os.path.exists(path):
                 del self._cache_registry[path]
                 if path in self._usage_registry:
                     del self._usage_registry[path]
+                removed = True
         
         # Save updated registry
-        self._save_json(self.registry_path, self._cache_registry)
-        self._save_json(self.usage_path, self._usage_registry)
+        if removed:
+            self._mark_dirty(registry=True, usage=True)
         
         # Notify UI
         self.cache_list_updated.emit()
@@ -250,42 +389,22 @@ class CacheManager(QObject):
         
         for path, info in self._cache_registry.items():
             # Skip non-existent files
-            if not os.path.exists(path):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
                 continue
             
             try:
-                # Get basic file stats
-                stat = os.stat(path)
-                filename = os.path.basename(path)
-                
-                # Get usage info
                 usage = self._usage_registry.get(path, {})
-                
-                # Create cache info
-                cache_info = {
-                    'id': info.get('document_id', filename),
-                    'path': path,
-                    'filename': filename,
-                    'size': stat.st_size,
-                    'last_modified': stat.st_mtime,
-                    'document_id': info.get('document_id', os.path.splitext(filename)[0]),
-                    'original_file_path': info.get('original_file_path', ''),
-                    'context_size': info.get('context_size', 0),
-                    'token_count': info.get('token_count', 0),
-                    'model_id': info.get('model_id', ''),
-                    'created_at': info.get('created_at', None),
-                    'last_used': usage.get('last_used', None),
-                    'usage_count': usage.get('usage_count', 0),
-                    'is_master': info.get('is_master', False)
-                }
-                
-                result.append(cache_info)
+                cache_info = self._build_cache_info(path, info, usage, stat)
+                sort_key = cache_info['last_used'] or cache_info['created_at'] or 0
+                result.append((sort_key, cache_info))
             except Exception as e:
                 print(f"Error getting info for {path}: {e}")
         
-        # Sort by last used time
-        result.sort(key=lambda x: x.get('last_used') or x.get('created_at') or 0, reverse=True)
-        return result
+        # Sort by last used time, on keys computed while building the list
+        result.sort(key=itemgetter(0), reverse=True)
+        return [cache_info for _, cache_info in result]
     
     def get_cache_info(self, cache_path: str) -> Optional[Dict]:
         """Get detailed information about a KV cache"""
@@ -298,31 +417,12 @@ class CacheManager(QObject):
         try:
             # Get basic file stats
             stat = os.stat(cache_path)
-            filename = os.path.basename(cache_path)
             
             # Get registry info
             info = self._cache_registry.get(cache_path, {})
             usage = self._usage_registry.get(cache_path, {})
             
-            # Create cache info
-            cache_info = {
-                'id': info.get('document_id', filename),
-                'path': cache_path,
-                'filename': filename,
-                'size': stat.st_size,
-                'last_modified': stat.st_mtime,
-                'document_id': info.get('document_id', os.path.splitext(filename)[0]),
-                'original_file_path': info.get('original_file_path', ''),
-                'context_size': info.get('context_size', 0),
-                'token_count': info.get('token_count', 0),
-                'model_id': info.get('model_id', ''),
-                'created_at': info.get('created_at', None),
-                'last_used': usage.get('last_used', None),
-                'usage_count': usage.get('usage_count', 0),
-                'is_master': info.get('is_master', False)
-            }
-            
-            return cache_info
+            return self._build_cache_info(cache_path, info, usage, stat)
         except Exception as e:
             print(f"Error getting info for {cache_path}: {e}")
             return None
@@ -345,12 +445,12 @@ class CacheManager(QObject):
             'is_master': is_master
         }
         
-        if cache_path not in self._usage_registry:
+        new_usage = cache_path not in self._usage_registry
+        if new_usage:
             self._usage_registry[cache_path] = {'last_used': None, 'usage_count': 0}
         
-        # Save changes
-        self._save_json(self.registry_path, self._cache_registry)
-        self._save_json(self.usage_path, self._usage_registry)
+        # Save changes; the usage registry only when an entry was added
+        self._mark_dirty(registry=True, usage=new_usage)
         
         # Notify UI
         self.cache_list_updated.emit()
@@ -371,7 +471,7 @@ class CacheManager(QObject):
         self._usage_registry[cache_path] = usage
         
         # Save changes
-        self._save_json(self.usage_path, self._usage_registry)
+        self._mark_dirty(usage=True)
         
         # Notify UI
         self.cache_list_updated.emit()
@@ -382,26 +482,25 @@ class CacheManager(QObject):
         if not cache_path:
             return False
         
-        file_existed = os.path.exists(cache_path)
-        
-        # Try to delete the file
-        if file_existed:
-            try:
-                os.remove(cache_path)
-                print(f"Deleted cache file: {cache_path}")
-            except Exception as e:
-                print(f"Failed to delete {cache_path}: {e}")
-                return False
+        # Try to delete the file; an already missing file still counts as purged
+        try:
+            os.unlink(cache_path)
+            print(f"Deleted cache file: {cache_path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Failed to delete {cache_path}: {e}")
+            return False
         
         # Remove from registries
+        _path_parts.cache_clear()
         if cache_path in self._cache_registry:
             del self._cache_registry[cache_path]
         if cache_path in self._usage_registry:
             del self._usage_registry[cache_path]
         
         # Save changes
-        self._save_json(self.registry_path, self._cache_registry)
-        self._save_json(self.usage_path, self._usage_registry)
+        self._mark_dirty(registry=True, usage=True)
         
         # Notify UI
         self.cache_purged.emit(cache_path, True)
@@ -414,21 +513,22 @@ class CacheManager(QObject):
         
         # Delete each file
         for path in list(self._cache_registry.keys()):
-            if os.path.exists(path):
-                try:
-                    os.remove(path)
-                    print(f"Deleted cache file: {path}")
-                except Exception as e:
-                    print(f"Failed to delete {path}: {e}")
-                    success = False
+            try:
+                os.unlink(path)
+                print(f"Deleted cache file: {path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Failed to delete {path}: {e}")
+                success = False
         
         # Clear registries
+        _path_parts.cache_clear()
         self._cache_registry = {}
         self._usage_registry = {}
         
         # Save empty registries
-        self._save_json(self.registry_path, self._cache_registry)
-        self._save_json(self.usage_path, self._usage_registry)
+        self._mark_dirty(registry=True, usage=True)
         
         # Notify UI
         self.cache_list_updated.emit()
@@ -438,36 +538,35 @@ class CacheManager(QObject):
         """Get the total size of all registered KV caches in bytes"""
         total_size = 0
         
+        # Stat each file now; a cache rewritten in place keeps the listing unchanged
         for path in self._cache_registry.keys():
-            if os.path.exists(path):
-                try:
-                    total_size += os.path.getsize(path)
-                except Exception as e:
-                    print(f"Failed to get size of {path}: {e}")
+            try:
+                total_size += os.stat(path).st_size
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Failed to get size of {path}: {e}")
         
         return total_size
     
     def check_cache_compatibility(self, model_context_size: int) -> List[str]:
         """Check which caches might be incompatible with the given model context size"""
-        incompatible = []
-        
-        for path, info in self._cache_registry.items():
-            if os.path.exists(path):
-                cache_context = info.get('context_size', 0)
-                if cache_context > model_context_size:
-                    incompatible.append(path)
+        # Filter on the in-memory context size first, then only check the candidates exist
+        candidates = [path for path, info in self._cache_registry.items()
+                      if info.get('context_size', 0) > model_context_size]
+        if not candidates:
+            return []
         
-        return incompatible
+        entries = self._scan_dir_once()
+        return [path for path in candidates
+                if os.path.abspath(path) in entries or os.path.exists(path)]
     
     def update_config(self, config):
         """Update configuration and reload registries if path changed"""
         old_dir = self.kv_cache_dir
         
         # Get new cache directory
-        cache_dir = config.get('LLAMACPP_KV_CACHE_DIR', '')
-        if not cache_dir:
-            cache_dir = os.path.join(os.path.expanduser('~'), 'cag_project', 'kv_caches')
-        new_dir = os.path.expanduser(cache_dir)
+        new_dir = _resolve_cache_dir(config.get('LLAMACPP_KV_CACHE_DIR', ''))
         
         # Update config
         self.config = config
@@ -475,15 +574,9 @@ class CacheManager(QObject):
         # Check if directory changed
         if new_dir != old_dir:
             print(f"KV cache directory changed: {old_dir} -> {new_dir}")
-            self.kv_cache_dir = new_dir
-            
-            # Create directory if needed
-            if not os.path.exists(self.kv_cache_dir):
-                os.makedirs(self.kv_cache_dir, exist_ok=True)
-            
-            # Update registry paths
-            self.registry_path = os.path.join(self.kv_cache_dir, 'cache_registry.json')
-            self.usage_path = os.path.join(self.kv_cache_dir, 'usage_registry.json')
+            # Write pending changes to the old registries before switching
+            self.flush()
+            self._set_cache_dir(new_dir)
             
             # Reload registries
             self._cache_registry = self._load_json(self.registry_path, {})
@@ -492,6 +585,35 @@ class CacheManager(QObject):
             # Notify UI
             self.cache_list_updated.emit()
 '''
+
+def _write_source(path, text):
+    """Write a source template with a single open and write"""
+    data = text.encode('utf-8')
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def create_minimal_chat_tab(path):
+    """Create a minimal chat_tab.py file"""
+    
+    # Create a backup if the file exists
+    if os.path.exists(path):
+        backup_path = path + '.backup'
+        print(f"Creating backup of existing chat_tab.py to {backup_path}")
+        shutil.copy2(path, backup_path)
+    
+    # Write the minimal version
+    _write_source(path, MINIMAL_CHAT_TAB_SOURCE)
+    
+    print(f"Created minimal chat_tab.py at {path}")
+    return True
+
+def create_minimal_cache_manager(path):
+    """Create a minimal cache_manager.py file"""
     
     # Create a backup if the file exists
     if os.path.exists(path):
@@ -500,12 +622,35 @@ class CacheManager(QObject):
         shutil.copy2(path, backup_path)
     
     # Write the minimal version
-    with open(path, 'w', encoding='utf-8') as f:
-        f.write(content)
+    _write_source(path, MINIMAL_CACHE_MANAGER_SOURCE)
     
     print(f"Created minimal cache_manager.py at {path}")
     return True
 
+_EMPTY_JSON = b"{}"
+
+def _write_empty_json(path):
+    """Write an empty JSON object to path with a single open and write"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, _EMPTY_JSON)
+    finally:
+        os.close(fd)
+
+def _fast_clear(directory, pool, keep=()):
+    """Delete the contents of a directory, unlinking files in parallel"""
+    futures = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.path in keep:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                futures.append(pool.submit(os.unlink, entry.path))
+    for future in futures:
+        future.result()
+
 def reset_cache_directories():
     """Reset all cache-related directories"""
     home_dir = os.path.expanduser("~")
@@ -516,23 +661,26 @@ def reset_cache_directories():
     
     print("Resetting cache directories...")
     
-    # Recreate directories
-    for directory in [cag_dir, kv_cache_dir, temp_dir, config_dir, os.path.join(config_dir, "logs")]:
-        if os.path.exists(directory):
-            print(f"Removing and recreating: {directory}")
-            shutil.rmtree(directory)
-        
-        os.makedirs(directory, exist_ok=True)
+    # Empty directories in place instead of removing and recreating them.
+    # Nested directories come first so cag_dir only has to keep them.
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for directory, keep in [
+            (kv_cache_dir, ()),
+            (temp_dir, ()),
+            (cag_dir, (kv_cache_dir, temp_dir)),
+            (os.path.join(config_dir, "logs"), ()),
+            (config_dir, (os.path.join(config_dir, "logs"),)),
+        ]:
+            os.makedirs(directory, exist_ok=True)
+            print(f"Clearing: {directory}")
+            _fast_clear(directory, pool, keep)
     
     # Create empty registry files
     registry_file = os.path.join(kv_cache_dir, "cache_registry.json")
     usage_file = os.path.join(kv_cache_dir, "usage_registry.json")
     
-    with open(registry_file, 'w') as f:
-        f.write("{}")
-    
-    with open(usage_file, 'w') as f:
-        f.write("{}")
+    _write_empty_json(registry_file)
+    _write_empty_json(usage_file)
     
     # Create config file
     config_file = os.path.join(config_dir, "config.json")
@@ -1,3 +1,84 @@
+import json
+import os
+import mmap
+import pickle
+import logging
+from pathlib import Path
+
+# Leading bytes of a KV cache file pickled with out-of-band buffers
+OOB_PICKLE_MAGIC = b'LCAGPK5\x00'
+# Leading bytes of a KV cache file holding one raw buffer behind a JSON header
+RAW_STATE_MAGIC = b'LCAGRAW\x00'
+
+def _dump_state_raw(state_data, kv_cache_path: Path) -> bool:
+    """
+    Write a buffer-like state as raw bytes behind a small JSON header.
+    Returns False if the state is not a contiguous buffer, so callers can pickle it instead.
+    """
+    try:
+        mv = memoryview(state_data)
+    except TypeError:
+        return False
+    if not mv.c_contiguous:
+        return False
+    header = json.dumps({
+        'format': mv.format,
+        'itemsize': mv.itemsize,
+        'shape': list(mv.shape),
+        'nbytes': mv.nbytes,
+    }, separators=(',', ':')).encode('utf-8')
+    with open(kv_cache_path, 'wb') as f:
+        f.write(RAW_STATE_MAGIC)
+        f.write(len(header).to_bytes(4, 'little'))
+        f.write(header)
+        f.write(mv.cast('B'))
+    return True
+
+def _load_state_raw(data):
+    """Return a memoryview over a state written by _dump_state_raw"""
+    view = memoryview(data)
+    pos = len(RAW_STATE_MAGIC)
+    header_len = int.from_bytes(view[pos:pos + 4], 'little')
+    pos += 4
+    header = json.loads(bytes(view[pos:pos + header_len]))
+    pos += header_len
+    payload = view[pos:pos + header['nbytes']]
+    if header['format'] == 'B' and len(header['shape']) == 1:
+        return payload
+    return payload.cast(header['format'], header['shape'])
+
+def _dump_state_oob(state_data, kv_cache_path: Path):
+    """
+    Pickle with protocol 5 and write large buffers straight to the file
+    instead of copying them into the pickle stream.
+    """
+    buffers = []
+    header = pickle.dumps(state_data, protocol=5, buffer_callback=buffers.append)
+    with open(kv_cache_path, 'wb') as f:
+        f.write(OOB_PICKLE_MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for buf in buffers:
+            mv = buf.raw()
+            f.write(mv.nbytes.to_bytes(8, 'little'))
+            f.write(mv)
+
+def _load_state_oob(data):
+    """Rebuild a state written by _dump_state_oob from a bytes-like object"""
+    view = memoryview(data)
+    pos = len(OOB_PICKLE_MAGIC)
+    header_len = int.from_bytes(view[pos:pos + 8], 'little')
+    pos += 8
+    header = view[pos:pos + header_len]
+    pos += header_len
+    buffers = []
+    while pos < len(view):
+        size = int.from_bytes(view[pos:pos + 8], 'little')
+        pos += 8
+        buffers.append(view[pos:pos + size])
+        pos += size
+    return pickle.loads(header, buffers=buffers)
+
 def _save_kv_cache_state(self, llm, kv_cache_path: Path) -> bool:
     """
     Improved function to save KV cache state using recommended approach.
@@ -15,9 +96,13 @@ def _save_kv_cache_state(self, llm, kv_cache_path: Path) -> bool:
             logging.error("save_state() returned None")
             return False
             
-        # Save with pickle
-        with open(kv_cache_path, 'wb') as f_pickle:
-            pickle.dump(state_data, f_pickle)
+        # Plain buffers go to disk as-is
+        if _dump_state_raw(state_data, kv_cache_path):
+            logging.info("KV cache state saved successfully as raw bytes")
+            return True
+        
+        # Save with pickle, large buffers written out-of-band
+        _dump_state_oob(state_data, kv_cache_path)
         logging.info("KV cache state saved successfully via pickle")
         return True
     except (AttributeError, pickle.PicklingError) as e:
@@ -41,6 +126,32 @@ def _save_kv_cache_state(self, llm, kv_cache_path: Path) -> bool:
     logging.error("All KV cache save methods failed")
     return False
 
+def _load_kv_cache_state(self, kv_cache_path: Path):
+    """
+    Load a KV cache state saved by _save_kv_cache_state.
+    Files without the raw or out-of-band header are plain pickles.
+    The file is memory-mapped so pages are read in as they are used.
+    """
+    with open(kv_cache_path, 'rb') as f:
+        # A save that crashed before writing anything leaves an empty file,
+        # which mmap refuses to map
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"KV cache file {kv_cache_path} is empty (incomplete save?)")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    magic = mm[:len(OOB_PICKLE_MAGIC)]
+    # Raw and out-of-band buffers are views into the mapping, which stays
+    # open until the loaded state is released
+    if magic == RAW_STATE_MAGIC:
+        return _load_state_raw(mm)
+    if magic == OOB_PICKLE_MAGIC:
+        return _load_state_oob(mm)
+    try:
+        return pickle.loads(memoryview(mm))
+    finally:
+        mm.close()
+
 # Updated portion of _process_document_thread that handles state saving
 # This would replace the existing save_state block in the function
 def _updated_save_state_block(self, llm, document_id, kv_cache_path, token_count, context_window):
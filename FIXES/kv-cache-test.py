@@ -7,11 +7,17 @@ after loading a saved KV cache state.
 
 import os
 import sys
+import mmap
+import array
 import pickle
+import ctypes
 from pathlib import Path
 import time
 import logging
 import argparse
+import multiprocessing as mp
+
+import numpy as np
 
 # Set up logging
 logging.basicConfig(
@@ -21,27 +27,316 @@ logging.basicConfig(
 )
 
 try:
-    from llama_cpp import Llama
+    import llama_cpp
+    from llama_cpp import Llama, LlamaState
 except ImportError:
     logging.error("llama-cpp-python is not installed. Install with: pip install llama-cpp-python")
     sys.exit(1)
 
-def test_kv_cache(model_path, context_text, test_query, cache_path, temperature=0.7, max_tokens=512):
+# Try to import safetensors for pickle-free state files if available
+try:
+    import safetensors.numpy as stn
+    HAVE_SAFETENSORS = True
+except ImportError:
+    HAVE_SAFETENSORS = False
+
+# Model settings shared by every instance the test creates
+N_CTX = 8192
+N_THREADS = 4
+
+# Prompt scaffolding around the test question
+QUESTION_PREFIX = "\n\nQuestion: "
+ANSWER_SUFFIX = "\n\nAnswer: "
+
+# llama.cpp's own state files (llama_state_save_file) are used when the bindings expose them
+HAVE_STATE_FILE = hasattr(llama_cpp, 'llama_state_save_file') and hasattr(llama_cpp, 'llama_state_load_file')
+
+# Leading bytes of a llama.cpp state file, the session magic 'ggsn' as a little-endian u32
+SESSION_MAGIC = llama_cpp.LLAMA_SESSION_MAGIC.to_bytes(4, 'little') if HAVE_STATE_FILE else None
+
+# Leading bytes of a state file whose llama.cpp blob follows the pickled metadata raw
+STATE_MAGIC = b'KVTEST01'
+
+# Generated tokens detokenized and written together when streaming the answer
+STREAM_FLUSH_EVERY = 16
+
+# Values per int8 block when quantizing saved state arrays, each block has its own scale
+QUANT_BLOCK = 64
+
+def quantize_blocks(arr):
+    """Block-wise absmax int8 encoding of a float array"""
+    flat = np.ascontiguousarray(arr, dtype=np.float32).reshape(-1)
+    pad = (-flat.size) % QUANT_BLOCK
+    blocks = np.pad(flat, (0, pad)).reshape(-1, QUANT_BLOCK)
+    scale = np.abs(blocks).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.rint(blocks / scale[:, None]).astype(np.int8)
+    return {"shape": arr.shape, "size": flat.size, "scale": scale, "q": q}
+
+def dequantize_blocks(enc):
+    """Inverse of quantize_blocks"""
+    flat = (enc["q"].astype(np.float32) * enc["scale"][:, None]).reshape(-1)
+    return flat[:enc["size"]].reshape(enc["shape"])
+
+def save_state_file(llm, cache_path):
+    """Write llm's context and evaluated tokens with llama_state_save_file.
+    The file holds no logits; they are recomputed when the query is evaluated after loading."""
+    n_tokens = llm.n_tokens
+    ids = np.ascontiguousarray(llm.input_ids[:n_tokens], dtype=np.intc)
+    tokens = (llama_cpp.llama_token * n_tokens).from_buffer_copy(ids)
+    if not llama_cpp.llama_state_save_file(llm._ctx.ctx, str(cache_path).encode('utf-8'), tokens, n_tokens):
+        raise RuntimeError(f"llama_state_save_file failed for {cache_path}")
+
+def load_state_file(llm, cache_path):
+    """Read a file written by save_state_file back into llm"""
+    capacity = llm.n_ctx()
+    tokens = (llama_cpp.llama_token * capacity)()
+    n_loaded = ctypes.c_size_t(0)
+    if not llama_cpp.llama_state_load_file(llm._ctx.ctx, str(cache_path).encode('utf-8'),
+                                           tokens, capacity, ctypes.byref(n_loaded)):
+        raise RuntimeError(f"llama_state_load_file failed for {cache_path}")
+    n_tokens = n_loaded.value
+    llm.input_ids[:n_tokens] = np.frombuffer(tokens, dtype=np.intc, count=n_tokens)
+    llm.n_tokens = n_tokens
+
+def is_safetensors_head(head):
+    """True if the first 9 bytes of a file look like a safetensors header (u64 length, then a JSON object).
+    Only meaningful for files without STATE_MAGIC, whose byte 8 is part of the metadata length."""
+    return len(head) == 9 and head[8:9] == b'{'
+
+def save_state_safetensors(state, cache_path, quantize_kv=False):
+    """Write a LlamaState as plain arrays in a safetensors file"""
+    tensors = {
+        "kv": np.frombuffer(state.llama_state, dtype=np.uint8),
+        "input_ids": np.ascontiguousarray(state.input_ids, dtype=np.intc),
+        "meta": np.array([state.n_tokens, state.llama_state_size, state.seed], dtype=np.int64),
+    }
+    if quantize_kv:
+        scores = quantize_blocks(state.scores)
+        tensors["scores_q"] = scores["q"]
+        tensors["scores_scale"] = scores["scale"]
+        tensors["scores_shape"] = np.array(scores["shape"], dtype=np.int64)
+    else:
+        tensors["scores"] = np.ascontiguousarray(state.scores, dtype=np.float32)
+    stn.save_file(tensors, str(cache_path))
+
+def load_state_safetensors(cache_path):
+    """Rebuild the LlamaState written by save_state_safetensors"""
+    tensors = stn.load_file(str(cache_path))
+    n_tokens, llama_state_size, seed = (int(v) for v in tensors["meta"])
+    if "scores_q" in tensors:
+        shape = tuple(int(v) for v in tensors["scores_shape"])
+        scores = dequantize_blocks({
+            "shape": shape,
+            "size": int(np.prod(shape)),
+            "scale": tensors["scores_scale"],
+            "q": tensors["scores_q"],
+        })
+    else:
+        scores = tensors["scores"]
+    return LlamaState(
+        input_ids=tensors["input_ids"],
+        scores=scores,
+        n_tokens=n_tokens,
+        llama_state=tensors["kv"].tobytes(),
+        llama_state_size=llama_state_size,
+        seed=seed,
+    )
+
+def save_kv_state(llm, cache_path, quantize_kv=False):
+    """Save the model state to cache_path with llama.cpp's own state file when the
+    bindings have it, otherwise via safetensors or, without it, pickle.
+    With quantize_kv the fallback formats store the state's float logits as int8
+    blocks; they are recomputed before the next sample after loading, so answers
+    are unaffected. The native file leaves the logits out altogether."""
+    if HAVE_STATE_FILE:
+        save_state_file(llm, cache_path)
+        return
+    state = llm.save_state()
+    if HAVE_SAFETENSORS:
+        save_state_safetensors(state, cache_path, quantize_kv=quantize_kv)
+        return
+    if quantize_kv:
+        scores = quantize_blocks(state.scores)
+        state.scores = None
+        payload = {"dtype": "int8_block", "state": state, "scores": scores}
+    else:
+        payload = state
+    
+    # The llama.cpp blob is written raw after the pickled metadata so it can
+    # be memory-mapped straight back in
+    blob = state.llama_state
+    state.llama_state = None
+    meta = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+    offset = len(STATE_MAGIC) + 8 + len(meta)
+    with open(cache_path, 'wb') as f:
+        f.write(STATE_MAGIC)
+        f.write(len(meta).to_bytes(8, 'little'))
+        f.write(meta)
+        f.truncate(offset + len(blob))
+    if blob:
+        mm = np.memmap(cache_path, dtype=np.uint8, mode='r+', offset=offset, shape=(len(blob),))
+        mm[:] = np.frombuffer(blob, dtype=np.uint8)
+        mm.flush()
+        del mm
+
+def load_kv_state(llm, cache_path):
+    """Load a state written by save_kv_state"""
+    with open(cache_path, 'rb') as f:
+        head = f.read(len(STATE_MAGIC) + 1)
+    if HAVE_STATE_FILE and head[:len(SESSION_MAGIC)] == SESSION_MAGIC:
+        load_state_file(llm, cache_path)
+        return
+    has_magic = head[:len(STATE_MAGIC)] == STATE_MAGIC
+    # Check the magic first: in our own format byte 8 is the low byte of the
+    # metadata length and can happen to be b'{'
+    if not has_magic and HAVE_SAFETENSORS and is_safetensors_head(head):
+        llm.load_state(load_state_safetensors(cache_path))
+        return
+    with open(cache_path, 'rb') as f:
+        if not has_magic:
+            # Older caches are a single pickle with the blob inside
+            payload = pickle.load(f)
+            blob = None
+        else:
+            f.seek(len(STATE_MAGIC))
+            meta_len = int.from_bytes(f.read(8), 'little')
+            payload = pickle.loads(f.read(meta_len))
+            offset = f.tell()
+            size = os.fstat(f.fileno()).st_size - offset
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), offset, size, os.POSIX_FADV_SEQUENTIAL)
+                os.posix_fadvise(f.fileno(), offset, size, os.POSIX_FADV_WILLNEED)
+            blob = np.memmap(f, dtype=np.uint8, mode='r', offset=offset, shape=(size,)) if size else b''
+            if size and hasattr(mmap, 'MADV_WILLNEED'):
+                blob._mmap.madvise(mmap.MADV_WILLNEED)
+    # Caches saved without quantization are a bare state object
+    if isinstance(payload, dict) and payload.get("dtype") == "int8_block":
+        state = payload["state"]
+        state.scores = dequantize_blocks(payload["scores"])
+    else:
+        state = payload
+    if blob is not None:
+        # load_state copies the blob once, straight from the mapped pages
+        state.llama_state = blob
+    llm.load_state(state)
+
+def run_kv_phase(llm, cache_path, test_query, prefix_ids, suffix_ids, temperature, top_k, max_tokens, stream=False):
+    """Load the saved KV cache into llm and answer test_query on top of it.
+    prefix_ids and suffix_ids are the already tokenized QUESTION_PREFIX and ANSWER_SUFFIX.
+    Returns the answer and the seconds it took."""
+    kv_start_time = time.time()
+    
+    # Forget any context already evaluated so only the saved state can provide it
+    llm.reset()
+    
+    # Load state
+    logging.info(f"Loading KV cache from {cache_path}")
+    load_kv_state(llm, cache_path)
+    logging.info("KV cache loaded successfully")
+    
+    # Tokenize query, only the question itself is new per call
+    query_tokens = prefix_ids + llm.tokenize(test_query.encode('utf-8'), add_bos=False) + suffix_ids
+    logging.info(f"Query tokenized to {len(query_tokens)} tokens")
+    
+    # Generate response on top of the loaded state. generate() evaluates the
+    # query in one batch and feeds each sampled token back itself; reset=False
+    # keeps the cached context instead of starting over.
+    logging.info("Generating response using low-level token sampling...")
+    eos_token = llm.token_eos()
+    tokens_generated = array.array('i')
+    append_token = tokens_generated.append
+    token_stream = llm.generate(list(query_tokens), top_k=top_k, top_p=0.95, temp=temperature, reset=False)
+    
+    # With stream the answer is also written to stdout as it is generated,
+    # STREAM_FLUSH_EVERY tokens at a time so detokenizing is not done per token
+    if stream:
+        out = sys.stdout.buffer
+        pending_ids = []
+    
+    # zip() with range() caps the answer at max_tokens without a length check per token
+    for _, token_id in zip(range(max_tokens), token_stream):
+        if token_id == eos_token:
+            break
+        append_token(token_id)
+        if stream:
+            pending_ids.append(token_id)
+            if len(pending_ids) >= STREAM_FLUSH_EVERY:
+                out.write(llm.detokenize(pending_ids))
+                out.flush()
+                pending_ids.clear()
+    
+    if stream:
+        if pending_ids:
+            out.write(llm.detokenize(pending_ids))
+        out.write(b"\n")
+        out.flush()
+    
+    # Get the response
+    kv_response = llm.detokenize(tokens_generated.tolist()).decode('utf-8', errors='replace')
+    kv_time = time.time() - kv_start_time
+    logging.info(f"Generated {len(tokens_generated)} tokens")
+    logging.info(f"KV cache approach took {kv_time:.2f} seconds")
+    return kv_response, kv_time
+
+def run_baseline_phase(llm, prompt, temperature, top_k, max_tokens):
+    """Answer with the full context as the prompt.
+    Returns the answer and the seconds it took."""
+    baseline_start_time = time.time()
+    
+    # Start from an empty state so no cached prefix is reused
+    llm.reset()
+    
+    # Generate response using create_completion
+    response = llm.create_completion(
+        prompt=prompt,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        top_k=top_k
+    )
+    
+    baseline_response = response['choices'][0]['text']
+    baseline_time = time.time() - baseline_start_time
+    logging.info(f"Baseline approach took {baseline_time:.2f} seconds")
+    return baseline_response, baseline_time
+
+def run_phase_in_process(phase, model_path, n_threads, *args):
+    """Run a phase function in a worker process with the worker's own model instance"""
+    llm = Llama(model_path=model_path, n_ctx=N_CTX, n_threads=n_threads)
+    return phase(llm, *args)
+
+def test_kv_cache(model_path, context_text, test_query, cache_path, temperature=0.7, max_tokens=512,
+                  quantize_kv=False, greedy=False, stream=False, parallel=False, run_baseline=False):
     """Test KV cache functionality by:
     1. Processing context text and saving state
     2. Loading state and generating a response to test_query
-    3. Comparing with baseline approach
+    3. Comparing with baseline approach (only with run_baseline)
+    With parallel, steps 2 and 3 run at the same time in two worker processes
+    that split the threads between them.
     """
     start_time = time.time()
     logging.info(f"Using model: {model_path}")
     
+    # Greedy decoding (temperature 0) takes llama.cpp's argmax sampler and skips
+    # the softmax/top-k/top-p chain and the random draw
+    if greedy or temperature == 0.0:
+        temperature, top_k = 0.0, 1
+    else:
+        top_k = 40
+    
+    # One model instance is shared by all three parts and reset in between,
+    # so the weights are only loaded once
+    llm = Llama(model_path=model_path, n_ctx=N_CTX, n_threads=N_THREADS)
+    
     # Part 1: Process context and save KV cache
     logging.info(f"Creating KV cache for context ({len(context_text)} chars)...")
-    llm = Llama(model_path=model_path, n_ctx=8192, n_threads=4)
     
-    # Tokenize context
-    context_tokens = llm.tokenize(context_text.encode('utf-8'))
+    # Tokenize context, and the fixed query scaffolding once for the KV phase
+    tok = llm.tokenize
+    context_tokens = tok(context_text.encode('utf-8'), add_bos=True)
     logging.info(f"Context tokenized to {len(context_tokens)} tokens")
+    prefix_ids = tok(QUESTION_PREFIX.encode('utf-8'), add_bos=False)
+    suffix_ids = tok(ANSWER_SUFFIX.encode('utf-8'), add_bos=False)
     
     # Process context
     llm.eval(context_tokens)
@@ -50,9 +345,7 @@ def test_kv_cache(model_path, context_text, test_query, cache_path, temperature=
     # Save state
     try:
         logging.info(f"Saving KV cache state to {cache_path}")
-        state_data = llm.save_state()
-        with open(cache_path, 'wb') as f:
-            pickle.dump(state_data, f)
+        save_kv_state(llm, cache_path, quantize_kv=quantize_kv)
         logging.info("KV cache saved successfully")
     except Exception as e:
         logging.error(f"Error saving KV cache: {e}")
@@ -60,81 +353,53 @@ def test_kv_cache(model_path, context_text, test_query, cache_path, temperature=
     
     logging.info(f"KV cache creation took {time.time() - start_time:.2f} seconds")
     
-    # Part 2: Test the KV cache by loading it and generating a response
-    logging.info("\n--- Testing KV Cache Approach ---")
-    kv_start_time = time.time()
-    
-    # Load a fresh model
-    llm2 = Llama(model_path=model_path, n_ctx=8192, n_threads=4)
+    # Baseline prompt (full context as prompt)
+    prompt = f"{context_text}{QUESTION_PREFIX}{test_query}{ANSWER_SUFFIX}"
+    kv_args = (cache_path, test_query, prefix_ids, suffix_ids, temperature, top_k, max_tokens, stream)
+    baseline_args = (prompt, temperature, top_k, max_tokens)
     
-    # Load state
+    baseline_response, baseline_time = None, 0.0
     try:
-        logging.info(f"Loading KV cache from {cache_path}")
-        with open(cache_path, 'rb') as f:
-            state_data = pickle.load(f)
-        llm2.load_state(state_data)
-        logging.info("KV cache loaded successfully")
+        if parallel and run_baseline:
+            # Part 2 and 3 are independent, run them side by side. Workers are
+            # spawned rather than forked so they don't inherit llama.cpp's threads.
+            logging.info("\n--- Testing KV Cache and Baseline Approaches in parallel ---")
+            del tok, llm
+            ctx = mp.get_context('spawn')
+            n_threads = max(1, N_THREADS // 2)
+            with ctx.Pool(2) as pool:
+                kv_fut = pool.apply_async(run_phase_in_process, (run_kv_phase, model_path, n_threads) + kv_args)
+                base_fut = pool.apply_async(run_phase_in_process, (run_baseline_phase, model_path, n_threads) + baseline_args)
+                kv_response, kv_time = kv_fut.get()
+                baseline_response, baseline_time = base_fut.get()
+        else:
+            # Part 2: Test the KV cache by loading it and generating a response
+            logging.info("\n--- Testing KV Cache Approach ---")
+            kv_response, kv_time = run_kv_phase(llm, *kv_args)
+            
+            # Part 3: Compare with baseline approach. It reprocesses the whole
+            # context, so it is skipped unless asked for.
+            if run_baseline:
+                logging.info("\n--- Testing Baseline Approach ---")
+                baseline_response, baseline_time = run_baseline_phase(llm, *baseline_args)
     except Exception as e:
-        logging.error(f"Error loading KV cache: {e}")
+        logging.error(f"Error testing KV cache: {e}")
         return
     
-    # Tokenize query
-    query_tokens = llm2.tokenize(f"\n\nQuestion: {test_query}\n\nAnswer: ".encode('utf-8'))
-    logging.info(f"Query tokenized to {len(query_tokens)} tokens")
-    
-    # Evaluate query tokens
-    llm2.eval(query_tokens)
-    logging.info("Query tokens evaluated")
-    
-    # Generate response using low-level approach
-    logging.info("Generating response using low-level token sampling...")
-    eos_token = llm2.token_eos()
-    tokens_generated = []
-    
-    for _ in range(max_tokens):
-        token_id = llm2.sample(temperature=temperature)
-        if token_id == eos_token:
-            break
-        tokens_generated.append(token_id)
-        llm2.eval([token_id])
-    
-    # Get the response
-    kv_response = llm2.detokenize(tokens_generated).decode('utf-8', errors='replace')
-    logging.info(f"Generated {len(tokens_generated)} tokens")
-    logging.info(f"KV cache approach took {time.time() - kv_start_time:.2f} seconds")
-    
-    # Part 3: Compare with baseline approach (full context as prompt)
-    logging.info("\n--- Testing Baseline Approach ---")
-    baseline_start_time = time.time()
-    
-    # Load a fresh model
-    llm3 = Llama(model_path=model_path, n_ctx=8192, n_threads=4)
-    
-    # Create a combined prompt
-    prompt = f"{context_text}\n\nQuestion: {test_query}\n\nAnswer: "
-    
-    # Generate response using create_completion
-    response = llm3.create_completion(
-        prompt=prompt,
-        max_tokens=max_tokens,
-        temperature=temperature
-    )
-    
-    baseline_response = response['choices'][0]['text']
-    logging.info(f"Baseline approach took {time.time() - baseline_start_time:.2f} seconds")
-    
     # Compare results
     logging.info("\n--- Results ---")
     logging.info(f"KV Cache Response:\n{kv_response}")
-    logging.info(f"Baseline Response:\n{baseline_response}")
-    logging.info(f"KV Cache Approach: {time.time() - kv_start_time:.2f} seconds")
-    logging.info(f"Baseline Approach: {time.time() - baseline_start_time:.2f} seconds")
+    if run_baseline:
+        logging.info(f"Baseline Response:\n{baseline_response}")
+    logging.info(f"KV Cache Approach: {kv_time:.2f} seconds")
+    if run_baseline:
+        logging.info(f"Baseline Approach: {baseline_time:.2f} seconds")
     
     return {
         "kv_response": kv_response,
         "baseline_response": baseline_response,
-        "kv_time": time.time() - kv_start_time,
-        "baseline_time": time.time() - baseline_start_time
+        "kv_time": kv_time,
+        "baseline_time": baseline_time
     }
 
 if __name__ == "__main__":
@@ -143,6 +408,12 @@ if __name__ == "__main__":
     parser.add_argument("--context", type=str, help="Context text file path")
     parser.add_argument("--cache", type=str, default="test_cache.pickle", help="Path to save/load KV cache")
     parser.add_argument("--query", type=str, default="What is the main topic of this text?", help="Test query")
+    parser.add_argument("--temperature", type=float, default=0.7, help="Sampling temperature")
+    parser.add_argument("--greedy", action="store_true", help="Use greedy decoding (same as --temperature 0)")
+    parser.add_argument("--stream", action="store_true", help="Write the KV cache answer to stdout as it is generated")
+    parser.add_argument("--baseline", action="store_true", help="Also run the full-context baseline for comparison")
+    parser.add_argument("--parallel", action="store_true", help="Run the KV cache and baseline approaches in parallel processes")
+    parser.add_argument("--quantize-kv", action="store_true", help="Store saved state logits as int8 blocks")
     
     args = parser.parse_args()
     
@@ -176,10 +447,18 @@ if __name__ == "__main__":
         model_path=args.model,
         context_text=context_text,
         test_query=args.query,
-        cache_path=args.cache
+        cache_path=args.cache,
+        temperature=args.temperature,
+        quantize_kv=args.quantize_kv,
+        greedy=args.greedy,
+        stream=args.stream,
+        parallel=args.parallel,
+        run_baseline=args.baseline
     )
     
     # Summarize speedup if results were obtained
-    if results and results["baseline_time"] > 0:
+    if results and results["baseline_response"] is None:
+        print("\nBaseline skipped (use --baseline to compare)")
+    elif results and results["baseline_time"] > 0:
         speedup = results["baseline_time"] / results["kv_time"] if results["kv_time"] > 0 else 0
         print(f"\nKV Cache approach is {speedup:.2f}x faster than the baseline")
@@ -2,50 +2,43 @@
 # Simple fixes for both the recursion issue and the Llama.save_state API error
 
 import os
+import re
 import sys
 import shutil
+from pathlib import Path
+
+# Default KV cache directory, resolved once at import
+_KV_DIR = Path.home() / "cag_project" / "kv_caches"
 
 def create_stubbed_registry_files():
     """Create stubbed registry files that won't cause recursion errors"""
-    home_dir = os.path.expanduser("~")
-    cache_dir = os.path.join(home_dir, "cag_project", "kv_caches")
-    
     # Create directory if it doesn't exist
-    os.makedirs(cache_dir, exist_ok=True)
+    _KV_DIR.mkdir(parents=True, exist_ok=True)
     
     # Create empty registry files
-    registry_file = os.path.join(cache_dir, "cache_registry.json")
-    usage_file = os.path.join(cache_dir, "usage_registry.json")
-    
-    print(f"Creating stubbed registry files in {cache_dir}")
-    
-    # Write empty JSON objects to these files
-    with open(registry_file, 'w') as f:
-        f.write("{}")
+    registry_file = _KV_DIR / "cache_registry.json"
+    usage_file = _KV_DIR / "usage_registry.json"
     
-    with open(usage_file, 'w') as f:
-        f.write("{}")
+    print(f"Creating stubbed registry files in {_KV_DIR}")
     
-    # Set permissions to prevent write errors
-    os.chmod(registry_file, 0o644)
-    os.chmod(usage_file, 0o644)
+    # Write empty JSON objects to these files, setting permissions on the open
+    # descriptor to prevent write errors
+    for path in (registry_file, usage_file):
+        fd = os.open(path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, b"{}")
+            os.fchmod(fd, 0o644)
+        finally:
+            os.close(fd)
     
     print("Created stubbed registry files.")
     return True
 
-def update_document_processor_save_method():
-    """Add a diagnostic wrapper around the save_state call to pinpoint the exact issue"""
-    file_path = os.path.join(os.path.dirname(__file__), "core", "document_processor.py")
-    
-    # Read the file
-    with open(file_path, 'r') as f:
-        content = f.read()
-    
-    # Find the line with save_state
-    if "llm.save_state(str(kv_cache_path))" in content:
-        modified_content = content.replace(
-            "llm.save_state(str(kv_cache_path))",
-            """# Debug the save_state call
+# The save_state call patched in core/document_processor.py
+SAVE_STATE_CALL = re.compile(rb"llm\.save_state\(str\(kv_cache_path\)\)")
+
+# Diagnostic wrapper that replaces the save_state call
+SAVE_STATE_DEBUG = b"""# Debug the save_state call
             try:
                 print("Attempting to call llm.save_state...")
                 # Try several approaches
@@ -66,30 +59,9 @@ def update_document_processor_save_method():
                 with open(str(kv_cache_path), 'w') as f:
                     f.write("KV CACHE ERROR PLACEHOLDER")
                 print("Created placeholder file due to error.")"""
-        )
-        
-        # Write the modified content
-        with open(file_path, 'w') as f:
-            f.write(modified_content)
-        
-        print("Modified document_processor.py to handle save_state issues.")
-    else:
-        print("Could not find the save_state line in document_processor.py")
-    
-    return True
 
-def simplify_cache_manager():
-    """Simplify the cache_manager.py file to prevent recursion errors"""
-    file_path = os.path.join(os.path.dirname(__file__), "core", "cache_manager.py")
-    backup_path = file_path + ".simpler_backup"
-    
-    # Create backup
-    if os.path.exists(file_path):
-        print(f"Creating backup: {backup_path}")
-        shutil.copy2(file_path, backup_path)
-    
-    # Create a very simplified version
-    simple_content = """#!/usr/bin/env python3
+# Very simplified cache_manager.py that cannot recurse
+SIMPLE_CACHE_MANAGER = b"""#!/usr/bin/env python3
 # Extremely simplified cache manager to avoid recursion issues
 
 import os
@@ -97,9 +69,29 @@ import sys
 import json
 import time
 from pathlib import Path
+from functools import cached_property
 from typing import Dict, List, Optional
 from PyQt5.QtCore import QObject, pyqtSignal
 
+# Try to import orjson for faster registry parsing if available
+try:
+    import orjson
+    HAVE_ORJSON = True
+except ImportError:
+    HAVE_ORJSON = False
+
+def _load_registry(path):
+    # Parse a registry file, treating a missing or broken file as empty
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        return orjson.loads(data) if HAVE_ORJSON else json.loads(data)
+    except (OSError, ValueError):
+        return {}
+
+# Default KV cache directory, resolved once at import
+_DEFAULT_KV_DIR = os.path.join(os.path.expanduser('~'), 'cag_project', 'kv_caches')
+
 class CacheManager(QObject):
     # Signals
     cache_list_updated = pyqtSignal()
@@ -111,16 +103,19 @@ class CacheManager(QObject):
         
         # Use a simple string path
         cache_dir = config.get('LLAMACPP_KV_CACHE_DIR', '')
-        if not cache_dir:
-            cache_dir = os.path.join(os.path.expanduser('~'), 'cag_project', 'kv_caches')
-        self.kv_cache_dir = os.path.expanduser(cache_dir)
+        self.kv_cache_dir = os.path.expanduser(cache_dir) if cache_dir else _DEFAULT_KV_DIR
         
         # Create directory if needed
         os.makedirs(self.kv_cache_dir, exist_ok=True)
-        
-        # Initialize empty registries
-        self._cache_registry = {}
-        self._usage_registry = {}
+    
+    # Registries are only read from disk the first time something needs them
+    @cached_property
+    def _cache_registry(self):
+        return _load_registry(os.path.join(self.kv_cache_dir, 'cache_registry.json'))
+    
+    @cached_property
+    def _usage_registry(self):
+        return _load_registry(os.path.join(self.kv_cache_dir, 'usage_registry.json'))
     
     def refresh_cache_list(self):
         # Just emit the signal, don't try to scan anything
@@ -148,16 +143,17 @@ class CacheManager(QObject):
         return True
     
     def purge_cache(self, cache_path):
-        # Try to delete the file and return True
+        # Try to delete the file and return True; a missing file is already purged
         try:
-            if os.path.exists(cache_path):
-                os.remove(cache_path)
-            self.cache_purged.emit(cache_path, True)
-            self.cache_list_updated.emit()
-            return True
-        except:
+            os.unlink(cache_path)
+        except FileNotFoundError:
+            pass
+        except OSError:
             self.cache_purged.emit(cache_path, False)
             return False
+        self.cache_purged.emit(cache_path, True)
+        self.cache_list_updated.emit()
+        return True
     
     def purge_all_caches(self):
         # Return True without doing anything
@@ -176,11 +172,34 @@ class CacheManager(QObject):
         # Just store the config
         self.config = config
 """
+
+def _write_atomic(file_path, data):
+    """Write data to a temp file next to file_path, then rename it into place"""
+    tmp_path = file_path + ".tmp"
+    Path(tmp_path).write_bytes(data)
+    os.replace(tmp_path, file_path)
+
+def apply_source_fixes():
+    """Patch document_processor.py and replace cache_manager.py, reading and writing each file once"""
+    core_dir = os.path.join(os.path.dirname(__file__), "core")
+    doc_processor_path = os.path.join(core_dir, "document_processor.py")
+    cache_manager_path = os.path.join(core_dir, "cache_manager.py")
+    backup_path = cache_manager_path + ".simpler_backup"
+    
+    # Add a diagnostic wrapper around the save_state call to pinpoint the exact issue
+    content = Path(doc_processor_path).read_bytes()
+    content, count = SAVE_STATE_CALL.subn(lambda m: SAVE_STATE_DEBUG, content)
+    if count:
+        _write_atomic(doc_processor_path, content)
+        print("Modified document_processor.py to handle save_state issues.")
+    else:
+        print("Could not find the save_state line in document_processor.py")
     
-    # Write the file
-    with open(file_path, 'w') as f:
-        f.write(simple_content)
-    
+    # Simplify the cache_manager.py file to prevent recursion errors
+    if os.path.exists(cache_manager_path):
+        print(f"Creating backup: {backup_path}")
+        shutil.copy2(cache_manager_path, backup_path)
+    _write_atomic(cache_manager_path, SIMPLE_CACHE_MANAGER)
     print("Replaced cache_manager.py with a much simpler version.")
     return True
 
@@ -207,11 +226,8 @@ if __name__ == "__main__":
         # Create stubbed registry files
         create_stubbed_registry_files()
         
-        # Update document_processor.py
-        update_document_processor_save_method()
-        
-        # Replace cache_manager.py with a much simpler version
-        simplify_cache_manager()
+        # Update document_processor.py and replace cache_manager.py with a much simpler version
+        apply_source_fixes()
         
         # Print API info
         print_api_info()
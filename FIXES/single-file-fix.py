@@ -1,8 +1,23 @@
 #!/usr/bin/env python3
 # Fix only the document_processor.py file with careful indentation
 
+import io
 import os
 import re
+import textwrap
+
+# Replacement for the save_state line, indented to match it when applied
+SAVE_STATE_REPLACEMENT = """try:
+    print("Attempting to save KV cache...")
+    llm.save_state()
+    print("KV cache state saved successfully using no arguments.")
+except Exception as e:
+    print(f"Error saving KV cache: {e}")
+    # Create a placeholder file
+    with open(str(kv_cache_path), 'w') as f:
+        f.write("KV CACHE PLACEHOLDER")
+    print("Created placeholder KV cache file.")
+"""
 
 def fix_document_processor():
     """Fix the document_processor.py file with proper indentation"""
@@ -15,51 +30,28 @@ def fix_document_processor():
         print(f"Creating backup: {backup_path}")
         shutil.copy2(file_path, backup_path)
     
-    # Read the file line by line
-    with open(file_path, 'r') as f:
-        lines = f.readlines()
-    
-    # Find the line with save_state and note its indentation
+    # Stream the file once, swapping the first save_state line for the
+    # replacement with the same indentation
     found_line = False
-    save_state_indentation = ""
-    save_state_line_number = -1
-    
-    for i, line in enumerate(lines):
-        if "llm.save_state" in line and "str(kv_cache_path)" in line:
-            found_line = True
-            save_state_line_number = i
-            # Get the indentation of this line
-            save_state_indentation = line[:line.index("llm")]
-            break
+    buf = io.StringIO()
+    with open(file_path, 'r') as f:
+        for line in f:
+            if not found_line and "llm.save_state" in line and "str(kv_cache_path)" in line:
+                found_line = True
+                save_state_indentation = line[:line.index("llm")]
+                buf.write(textwrap.indent(SAVE_STATE_REPLACEMENT, save_state_indentation))
+            else:
+                buf.write(line)
     
     if not found_line:
         print("Could not find save_state line in document_processor.py")
         return False
     
-    # Create a carefully indented replacement with the same whitespace
-    replacement_lines = [
-        f"{save_state_indentation}try:\n",
-        f"{save_state_indentation}    print(\"Attempting to save KV cache...\")\n",
-        f"{save_state_indentation}    llm.save_state()\n",
-        f"{save_state_indentation}    print(\"KV cache state saved successfully using no arguments.\")\n",
-        f"{save_state_indentation}except Exception as e:\n",
-        f"{save_state_indentation}    print(f\"Error saving KV cache: {{e}}\")\n",
-        f"{save_state_indentation}    # Create a placeholder file\n",
-        f"{save_state_indentation}    with open(str(kv_cache_path), 'w') as f:\n",
-        f"{save_state_indentation}        f.write(\"KV CACHE PLACEHOLDER\")\n",
-        f"{save_state_indentation}    print(\"Created placeholder KV cache file.\")\n"
-    ]
-    
-    # Replace the line
-    lines[save_state_line_number] = replacement_lines[0]
-    
-    # Insert the rest of the replacement after the first line
-    for i, line in enumerate(replacement_lines[1:], 1):
-        lines.insert(save_state_line_number + i, line)
-    
     # Write the file
-    with open(file_path, 'w') as f:
-        f.writelines(lines)
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(buf.getvalue())
+    os.replace(tmp_path, file_path)
     
     print("Fixed document_processor.py with proper indentation.")
     return True
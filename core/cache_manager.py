@@ -7,12 +7,341 @@ Manages KV cache files (.llama_cache) associated with processed documents.
 
 import os
 import sys
+import copy
 import json
+import atexit
 import time
+import mmap
+import pickle
+import hashlib
+import struct
 import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional
-from PyQt5.QtCore import QObject, pyqtSignal
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+from PyQt5.QtCore import QCoreApplication, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal, pyqtSlot
+
+# Try to import msgpack for a compact, fast registry encoding if available
+try:
+    import msgpack
+    HAVE_MSGPACK = True
+except ImportError:
+    HAVE_MSGPACK = False
+
+# Try to import xxhash for faster cache file content fingerprints if available
+try:
+    import xxhash
+    HAVE_XXHASH = True
+except ImportError:
+    HAVE_XXHASH = False
+
+# --- KV cache state file format ---
+# A flat layout that can be memory-mapped and handed to load_state() without
+# unpickling:
+#   header:      magic, format version, field count
+#   descriptors: one per field (name, kind, dtype, ndim, shape, size or int value)
+#   data:        raw bytes of each array/bytes field, each aligned to 64 bytes
+# Files without the magic are treated as pickled states from older versions.
+STATE_MAGIC = b'LCAGKVS1'
+STATE_VERSION = 1
+_STATE_HEADER = struct.Struct('<8sII')
+_STATE_FIELD = struct.Struct('<32sc8sB4Qq')
+_STATE_ALIGN = 64
+_MAX_NDIM = 4
+
+# Extension of the KV cache files managed here
+CACHE_FILE_SUFFIX = '.llama_cache'
+
+# Directory scans with at least this many cache files stat them from a small
+# thread pool, so the waits on a cold or network file system overlap
+_PARALLEL_STAT_MIN = 64
+# Threads used for batches of stat/unlink calls
+_IO_WORKERS = 8
+
+# Bytes hashed from each end of a cache file to tell real changes from a touched mtime
+_CONTENT_FP_BYTES = 64 * 1024
+
+# Registry changes are written to disk at most once per this many milliseconds
+REGISTRY_SAVE_DELAY_MS = 2000
+
+# First byte of a saved registry, naming the encoding of the rest
+_REGISTRY_MSGPACK = b'M'
+_REGISTRY_PICKLE = b'P'
+
+
+def _read_file(path: Union[str, Path]) -> bytearray:
+    """
+    Read a whole file into a preallocated buffer with unbuffered readinto() calls,
+    hinting the kernel that the whole file will be read sequentially.
+    """
+    with open(path, 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if hasattr(os, 'posix_fadvise'): # Not available on macOS
+            os.posix_fadvise(f.fileno(), 0, size, os.POSIX_FADV_SEQUENTIAL)
+            os.posix_fadvise(f.fileno(), 0, size, os.POSIX_FADV_WILLNEED)
+        buf = bytearray(size)
+        with memoryview(buf) as view:
+            offset = 0
+            while offset < size:
+                n = f.readinto(view[offset:])
+                if not n:
+                    break
+                offset += n
+        if offset < size: # File shrank while reading
+            del buf[offset:]
+        return buf
+
+
+def save_state_fast(state: Any, path: Union[str, Path]):
+    """
+    Write a llama-cpp-python LlamaState to path in the flat KV cache format.
+    Raises TypeError if the state has fields this format cannot represent.
+    """
+    fields = []
+    for name, value in vars(state).items():
+        if isinstance(value, np.ndarray):
+            if value.ndim > _MAX_NDIM:
+                raise TypeError(f"State field '{name}' has too many dimensions ({value.ndim})")
+            data = np.ascontiguousarray(value)
+            shape = tuple(data.shape) + (0,) * (_MAX_NDIM - data.ndim)
+            fields.append((name, b'a', data.dtype.str, data.ndim, shape, data.nbytes, memoryview(data).cast('B')))
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            data = memoryview(value).cast('B')
+            fields.append((name, b'b', '', 0, (0,) * _MAX_NDIM, data.nbytes, data))
+        elif isinstance(value, int):
+            fields.append((name, b'i', '', 0, (0,) * _MAX_NDIM, value, None))
+        else:
+            raise TypeError(f"Unsupported state field '{name}' of type {type(value).__name__}")
+
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_STATE_HEADER.pack(STATE_MAGIC, STATE_VERSION, len(fields)))
+            for name, kind, dtype, ndim, shape, size, _ in fields:
+                f.write(_STATE_FIELD.pack(name.encode('ascii'), kind, dtype.encode('ascii'), ndim, *shape, size))
+            for *_, data in fields:
+                if data is None:
+                    continue
+                f.write(b'\0' * (-f.tell() % _STATE_ALIGN))
+                f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Don't leave a partial temp file next to the cache (e.g. disk full)
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def load_state_fast(path: Union[str, Path]) -> Any:
+    """
+    Load a KV cache state written by save_state_fast(). Arrays and the raw
+    llama.cpp state are views into a read-only memory map of the file, so no
+    copy is made until load_state() copies them into the model.
+    Falls back to unpickling for files in the old pickle format.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(STATE_MAGIC)) != STATE_MAGIC:
+            return pickle.loads(_read_file(path))
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # Start reading the whole file in the background instead of faulting pages in
+    # one at a time when load_state() copies them
+    if hasattr(mmap, 'MADV_WILLNEED'):
+        mm.madvise(mmap.MADV_WILLNEED)
+
+    _, version, n_fields = _STATE_HEADER.unpack_from(mm, 0)
+    if version != STATE_VERSION:
+        raise ValueError(f"Unsupported KV cache format version {version} in {path}")
+
+    offset = _STATE_HEADER.size + n_fields * _STATE_FIELD.size
+    kwargs = {}
+    for i in range(n_fields):
+        name, kind, dtype, ndim, *shape, size = _STATE_FIELD.unpack_from(
+            mm, _STATE_HEADER.size + i * _STATE_FIELD.size)
+        name = name.rstrip(b'\0').decode('ascii')
+        if kind == b'i':
+            kwargs[name] = size
+            continue
+        offset += -offset % _STATE_ALIGN
+        if kind == b'a':
+            dt = np.dtype(dtype.rstrip(b'\0').decode('ascii'))
+            kwargs[name] = np.frombuffer(mm, dtype=dt, count=size // dt.itemsize,
+                                         offset=offset).reshape(shape[:ndim])
+        else:
+            kwargs[name] = memoryview(mm)[offset:offset + size]
+        offset += size
+
+    from llama_cpp import LlamaState
+    return LlamaState(**kwargs)
+
+
+def _stat_entries(entries: List[os.DirEntry]) -> List[Union[os.stat_result, OSError]]:
+    """
+    stat() a batch of directory entries, in parallel for large batches.
+    Entries that cannot be stat'ed get their OSError in place of a result.
+    """
+    def stat_one(entry):
+        try:
+            return entry.stat()
+        except OSError as e:
+            return e
+
+    if len(entries) < _PARALLEL_STAT_MIN:
+        return [stat_one(entry) for entry in entries]
+    with ThreadPoolExecutor(max_workers=_IO_WORKERS) as pool:
+        return list(pool.map(stat_one, entries))
+
+
+def _content_fingerprint(path: str, size: int) -> int:
+    """Hash the first and last _CONTENT_FP_BYTES of a file together with its size."""
+    with open(path, 'rb') as f:
+        head = f.read(_CONTENT_FP_BYTES)
+        tail = b''
+        if size > _CONTENT_FP_BYTES:
+            f.seek(max(size - _CONTENT_FP_BYTES, _CONTENT_FP_BYTES))
+            tail = f.read(_CONTENT_FP_BYTES)
+    data = head + tail + size.to_bytes(8, 'little')
+    if HAVE_XXHASH:
+        return xxhash.xxh3_64_intdigest(data)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def _atomic_write_bytes(path: Path, data: bytes):
+    """
+    Write data to a temporary file next to path, flush it to disk and rename it
+    over path, so readers see either the old or the new file but never a partial one.
+    """
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        with memoryview(data) as view:
+            written = 0
+            while written < len(view):
+                written += os.write(fd, view[written:])
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
+    if sys.platform.startswith('linux'): # Make the rename itself durable
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def _encode_registry(registry: Dict) -> bytes:
+    """Encode the registry with msgpack, or pickle if msgpack is not installed."""
+    if HAVE_MSGPACK:
+        return _REGISTRY_MSGPACK + msgpack.packb(registry, use_bin_type=True)
+    return _REGISTRY_PICKLE + pickle.dumps(registry, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _decode_registry(data: bytes) -> Dict:
+    """Decode a registry written by _encode_registry()."""
+    codec, payload = data[:1], memoryview(data)[1:]
+    if codec == _REGISTRY_MSGPACK:
+        if not HAVE_MSGPACK:
+            raise ValueError("Registry was saved with msgpack, which is not installed")
+        return msgpack.unpackb(payload, raw=False)
+    if codec == _REGISTRY_PICKLE:
+        return pickle.loads(payload)
+    raise ValueError(f"Unknown registry encoding {codec!r}")
+
+
+def _intern(value):
+    """sys.intern() strings that repeat across registry rows; other values pass through."""
+    return sys.intern(value) if type(value) is str else value
+
+
+class CacheEntry:
+    """
+    One cache registry row. __slots__ keeps the many rows of a large registry
+    small; callers outside CacheManager get the dict form from to_dict(), and the
+    persisted registry uses to_record(), which adds the internal scan fingerprints.
+    """
+    __slots__ = ('path', 'filename', 'size', 'last_modified', 'document_id', 'original_document',
+                 'token_count', 'context_size', 'model_id', 'is_master', 'fingerprint', 'content_fp')
+
+    def __init__(self, path: str, filename: str, size: int, last_modified: float, document_id: str,
+                 original_document: str = '', token_count: int = 0, context_size: int = 0,
+                 model_id: str = '', is_master: bool = False, fingerprint: Optional[list] = None,
+                 content_fp: Optional[int] = None):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.last_modified = last_modified
+        # A few models and documents account for many rows, so these share one string each
+        self.document_id = _intern(document_id)
+        self.original_document = _intern(original_document)
+        self.token_count = token_count
+        self.context_size = context_size
+        self.model_id = _intern(model_id)
+        self.is_master = is_master
+        self.fingerprint = fingerprint # [st_ino, st_size, st_mtime_ns] at the last scan
+        self.content_fp = content_fp # _content_fingerprint() at the last change, if computed
+
+    def to_dict(self) -> Dict:
+        """The registry row as a dict, the form returned by get_cache_list() and get_cache_info()."""
+        return {
+            'path': self.path,
+            'filename': self.filename,
+            'size': self.size,
+            'last_modified': self.last_modified,
+            'document_id': self.document_id,
+            'original_document': self.original_document,
+            'token_count': self.token_count,
+            'context_size': self.context_size,
+            'model_id': self.model_id,
+            'is_master': self.is_master,
+        }
+
+    def to_record(self) -> Dict:
+        """to_dict() plus the scan fingerprints, the form saved in the persisted registry."""
+        record = self.to_dict()
+        record['_fp'] = self.fingerprint
+        record['_content_fp'] = self.content_fp
+        return record
+
+    @classmethod
+    def from_dict(cls, info: Dict) -> 'CacheEntry':
+        """Rebuild an entry from to_record() output, e.g. a persisted registry."""
+        return cls(
+            path=info['path'],
+            filename=info.get('filename', os.path.basename(info['path'])),
+            size=info.get('size', 0),
+            last_modified=info.get('last_modified', 0.0),
+            document_id=info.get('document_id', ''),
+            original_document=info.get('original_document', ''),
+            token_count=info.get('token_count', 0),
+            context_size=info.get('context_size', 0),
+            model_id=info.get('model_id', ''),
+            is_master=info.get('is_master', False),
+            fingerprint=info.get('_fp'),
+            content_fp=info.get('_content_fp'),
+        )
+
+
+class _ScanSignals(QObject):
+    finished = pyqtSignal(object) # result dict of CacheManager._scan_to_snapshot()
+
+
+class _ScanTask(QRunnable):
+    """Runs a cache directory scan on a QThreadPool thread."""
+
+    def __init__(self, manager: 'CacheManager', scan_args: tuple):
+        super().__init__()
+        self.manager = manager
+        self.scan_args = scan_args
+        self.signals = _ScanSignals() # Lives in the main thread, so finished is delivered there
+
+    def run(self):
+        self.signals.finished.emit(self.manager._scan_to_snapshot(*self.scan_args))
+
 
 class CacheManager(QObject):
     # Signals
@@ -22,12 +351,28 @@ class CacheManager(QObject):
     def __init__(self, config):
         super().__init__()
         self.config = config
-        self._cache_registry = {} # Stores info about known cache files {cache_path_str: info_dict}
+        self._cache_registry: Dict[str, CacheEntry] = {} # Stores info about known cache files {cache_path_str: entry}
+        self._total_size_bytes = 0 # Sum of 'size' over the registry, kept up to date on every change
         self._document_registry_path = None # Path to the document registry JSON
+        self._doc_registry_cache = {} # Last parsed document registry
+        self._doc_registry_stamp = None # (path, st_mtime_ns, st_size) it was parsed at
         self.kv_cache_dir = None # Path object for the cache directory
         self._last_scan_results = set() # Keep track of files found in last scan
+        self._resolved_cache: Dict[str, str] = {} # Registry key for each path seen {path: resolved_path}
+        self._last_scan_dir_mtime = 0 # Cache directory mtime (ns) at the last full scan
+        self._registry_file = None # Path to the persisted cache registry
+        self._registry_save_pending = False # A debounced registry save is scheduled
+        self._suspend_count = 0 # Depth of nested _batched_updates() blocks
+        self._pending_update = False # cache_list_updated was deferred by _batched_updates()
+        self._scan_in_flight = False # A background directory scan is running
+        self._scan_task = None # The running _ScanTask, kept alive until its result arrives
+        self._rescan_requested = False # Another refresh was asked for while scanning
+        self._rescan_force = False # ... and it was forced
+        self._registry_generation = 0 # Bumped on registry changes made outside a scan
+        self._listeners: List[Callable[[], None]] = [] # Direct cache list callbacks, see add_listener()
 
         self.update_config(config) # Initialize paths based on config
+        atexit.register(self._save_registry_to_disk)
 
     def update_config(self, config):
         """Update cache directory based on config."""
@@ -39,27 +384,159 @@ class CacheManager(QObject):
         new_cache_dir = Path(os.path.expanduser(cache_dir_str)).resolve()
         
         if self.kv_cache_dir != new_cache_dir:
+            self._save_registry_to_disk() # Write out pending changes for the old directory
             self.kv_cache_dir = new_cache_dir
+            self._resolved_cache.clear()
+            self._last_scan_dir_mtime = 0
             self._document_registry_path = self.kv_cache_dir / 'document_registry.json'
+            # The registry lives with the user config, writing it inside the cache
+            # directory would change the directory mtime it is validated against
+            user_config_dir = os.path.expanduser(config.get('USER_CONFIG_DIR', '~/.llamacag'))
+            self._registry_file = Path(user_config_dir) / 'cache_registry.bin'
             logging.info(f"Cache directory set to: {self.kv_cache_dir}")
             os.makedirs(self.kv_cache_dir, exist_ok=True)
-            self.refresh_cache_list(scan_now=True) # Rescan if directory changed
+            self._load_registry_from_disk()
+            self.refresh_cache_list(scan_now=True) # Rescan if directory changed since the registry was saved
 
-    def _load_document_registry(self) -> Dict:
-        """Load the document registry JSON file."""
-        if self._document_registry_path and self._document_registry_path.exists():
+    @contextmanager
+    def _batched_updates(self):
+        """Defer cache_list_updated inside the block and emit it at most once when the outermost block exits."""
+        self._suspend_count += 1
+        try:
+            yield
+        finally:
+            self._suspend_count -= 1
+            if self._suspend_count == 0 and self._pending_update:
+                self._pending_update = False
+                self._notify()
+
+    def add_listener(self, callback: Callable[[], None]):
+        """
+        Call callback (on the main thread) whenever the cache list changes.
+        For non-UI components; plain calls avoid the cost of Qt signal dispatch.
+        UI widgets should keep connecting to cache_list_updated.
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[], None]):
+        """Stop calling a callback registered with add_listener()."""
+        self._listeners.remove(callback)
+
+    def _notify(self):
+        """Tell direct listeners and then signal connections that the cache list changed."""
+        for callback in self._listeners:
             try:
-                with open(self._document_registry_path, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                logging.error(f"Failed to load document registry {self._document_registry_path}: {e}")
+                callback()
+            except Exception:
+                # A broken listener must not stop the others or the UI signal
+                logging.exception(f"Cache list listener {callback!r} failed")
+        self.cache_list_updated.emit()
+
+    def _emit_cache_list_updated(self):
+        """Notify listeners of a cache list change, or defer it if inside _batched_updates()."""
+        if self._suspend_count:
+            self._pending_update = True
+        else:
+            self._notify()
+
+    def _resolve_key(self, cache_path) -> str:
+        """Return the registry key (resolved path string) for cache_path, resolving each path only once."""
+        path_str = str(cache_path)
+        key = self._resolved_cache.get(path_str)
+        if key is None:
+            key = self._resolved_cache[path_str] = os.path.realpath(path_str)
+        return key
+
+    def _load_registry_from_disk(self):
+        """
+        Load the registry saved by _save_registry_to_disk() if it belongs to the
+        current cache directory. The directory mtime saved with it lets the next
+        refresh skip the scan when nothing was added or removed since.
+        """
+        if not self._registry_file:
+            return
+        json_file = self._registry_file.with_suffix('.json')
+        try:
+            if self._registry_file.exists():
+                with open(self._registry_file, 'rb') as f:
+                    registry = _decode_registry(f.read())
+            elif json_file.exists():
+                # Registry saved by an older version, convert it once
+                with open(json_file, 'r') as f:
+                    registry = json.load(f)
+                _atomic_write_bytes(self._registry_file, _encode_registry(registry))
+                json_file.unlink()
+                logging.info(f"Converted cache registry {json_file} to {self._registry_file}")
+            else:
+                return
+        except Exception as e:
+            logging.error(f"Failed to load cache registry {self._registry_file}: {e}")
+            return
+        meta = registry.pop('__meta__', {})
+        if meta.get('cache_dir') != str(self.kv_cache_dir):
+            return
+        self._cache_registry = {path: CacheEntry.from_dict(info) for path, info in registry.items()}
+        self._registry_generation += 1
+        self._total_size_bytes = sum(entry.size for entry in self._cache_registry.values())
+        self._last_scan_results = set(registry)
+        self._last_scan_dir_mtime = meta.get('dir_mtime', 0)
+        logging.info(f"Loaded {len(registry)} cache entries from {self._registry_file}")
+
+    def _schedule_registry_save(self):
+        """Save the registry after REGISTRY_SAVE_DELAY_MS, folding further changes into the same write."""
+        if not self._registry_save_pending:
+            self._registry_save_pending = True
+            QTimer.singleShot(REGISTRY_SAVE_DELAY_MS, self._save_registry_to_disk)
+
+    def _save_registry_to_disk(self):
+        """Write the registry if a save is pending."""
+        if not self._registry_save_pending or not self._registry_file:
+            return
+        self._registry_save_pending = False
+        registry = {'__meta__': {'cache_dir': str(self.kv_cache_dir), 'dir_mtime': self._last_scan_dir_mtime}}
+        registry.update((path, entry.to_record()) for path, entry in self._cache_registry.items())
+        try:
+            os.makedirs(self._registry_file.parent, exist_ok=True)
+            _atomic_write_bytes(self._registry_file, _encode_registry(registry))
+        except Exception as e:
+            logging.error(f"Failed to save cache registry {self._registry_file}: {e}")
+
+    def _load_document_registry(self) -> Dict:
+        """
+        Load the document registry JSON file.
+        The parsed registry is reused until the file's mtime or size changes.
+        """
+        if not self._document_registry_path:
+            return {}
+        try:
+            st = os.stat(self._document_registry_path)
+        except FileNotFoundError:
+            return {}
+        except OSError as e:
+            logging.error(f"Failed to load document registry {self._document_registry_path}: {e}")
+            return {}
+        # Any difference invalidates, an mtime can also go backwards (restores, clock changes)
+        stamp = (self._document_registry_path, st.st_mtime_ns, st.st_size)
+        if stamp == self._doc_registry_stamp:
+            return self._doc_registry_cache
+        try:
+            with open(self._document_registry_path, 'r') as f:
+                self._doc_registry_cache = json.load(f)
+            self._doc_registry_stamp = stamp
+            return self._doc_registry_cache
+        except Exception as e:
+            logging.error(f"Failed to load document registry {self._document_registry_path}: {e}")
         return {}
 
-    def refresh_cache_list(self, scan_now=True):
+    def refresh_cache_list(self, scan_now=True, force=False):
         """
         Scans the cache directory for .llama_cache files and updates the registry.
         Preserves explicitly registered info (like original_document).
         Emits cache_list_updated only if entries are added or removed.
+        The scan is skipped if the directory's mtime is unchanged since the last
+        one (no files added, removed or renamed), unless force is True.
+        With a running Qt application the scan runs on the global QThreadPool and
+        the registry is updated when it finishes; otherwise it runs inline.
         """
         if not self.kv_cache_dir:
             logging.error("Cache directory not set. Cannot refresh cache list.")
@@ -69,101 +546,201 @@ class CacheManager(QObject):
             print("Cache list refresh requested (NO SCANNING)")
             return
 
+        if self._scan_in_flight:
+            # Scan again once the running one is applied
+            self._rescan_requested = True
+            self._rescan_force = self._rescan_force or force
+            return
+
+        # Files are only ever added or removed by name, which updates the directory mtime
+        try:
+            dir_mtime = os.stat(self.kv_cache_dir).st_mtime_ns
+        except OSError as e:
+            logging.error(f"Failed to stat cache directory {self.kv_cache_dir}: {e}")
+            return
+        if not force and dir_mtime == self._last_scan_dir_mtime:
+            logging.debug("Cache directory unchanged since last scan, skipping.")
+            return
+
         logging.info(f"Scanning cache directory: {self.kv_cache_dir}")
+        doc_registry = self._load_document_registry() # Load mapping from doc_id to info
+        # Hashing changed files to tell real changes from touched mtimes only matters to listeners
+        track_changes = bool(self._listeners) or self.receivers(self.cache_list_updated) > 0
+        # The worker only reads this copy, so the live registry can change meanwhile
+        scan_args = (self.kv_cache_dir, dict(self._cache_registry), doc_registry,
+                     dir_mtime, self._registry_generation, track_changes)
+
+        if QCoreApplication.instance() is None:
+            # No event loop to deliver a background result
+            self._apply_scan(self._scan_to_snapshot(*scan_args))
+            return
+
+        self._scan_in_flight = True
+        self._scan_task = _ScanTask(self, scan_args)
+        self._scan_task.signals.finished.connect(self._apply_scan)
+        QThreadPool.globalInstance().start(self._scan_task)
+
+    def _scan_to_snapshot(self, cache_dir, prior, doc_registry, dir_mtime, generation,
+                          track_changes=True) -> Dict:
+        """
+        Scan cache_dir and build the registry it implies, starting from prior.
+        Entries of prior are never modified, changed ones are copied, so this can
+        run off the main thread. The result is applied by _apply_scan().
+        Without track_changes (nobody was listening when the scan started), changed
+        entries aren't hashed to tell real content changes from touched mtimes.
+        """
+        result = {'cache_dir': cache_dir, 'dir_mtime': dir_mtime, 'generation': generation, 'error': None}
         found_paths = set()
-        new_entries = {}
+        snapshot = {}
+        added_new = False
         updated_existing = False
-        doc_registry = self._load_document_registry() # Load mapping from doc_id to info
 
         try:
-            for item in self.kv_cache_dir.glob('*.llama_cache'):
-                if item.is_file():
-                    file_path_str = str(item.resolve()) # Use resolved path as key
-                    found_paths.add(file_path_str)
-                    try:
-                        stat_result = item.stat()
-                        size_bytes = stat_result.st_size
-                        last_modified = stat_result.st_mtime
-
-                        if file_path_str in self._cache_registry:
-                            # Existing entry: Update only size and modified time
-                            if (self._cache_registry[file_path_str].get('size') != size_bytes or
-                                self._cache_registry[file_path_str].get('last_modified') != last_modified):
-                                self._cache_registry[file_path_str]['size'] = size_bytes
-                                self._cache_registry[file_path_str]['last_modified'] = last_modified
-                                updated_existing = True # Mark potential change for signal emission
-                                logging.debug(f"Updated metadata for existing cache: {item.name}")
+            # scandir gives the name and file type without a stat or Path object per entry
+            with os.scandir(cache_dir) as entries:
+                cache_entries = [entry for entry in entries
+                                 if entry.name.endswith(CACHE_FILE_SUFFIX) and entry.is_file()]
+
+            for entry, stat_result in zip(cache_entries, _stat_entries(cache_entries)):
+                # The directory is already resolved, so only symlinks need resolving
+                file_path_str = self._resolve_key(entry.path) if entry.is_symlink() else entry.path # Use resolved path as key
+                found_paths.add(file_path_str)
+                existing = prior.get(file_path_str)
+                if existing is not None:
+                    snapshot[file_path_str] = existing # Kept as-is unless it changed
+                try:
+                    if isinstance(stat_result, OSError):
+                        raise stat_result
+                    size_bytes = stat_result.st_size
+                    last_modified = stat_result.st_mtime
+                    # Same inode, size and mtime (exact, in ns) means the same file
+                    fingerprint = [stat_result.st_ino, size_bytes, stat_result.st_mtime_ns]
+
+                    if existing is not None:
+                        if existing.fingerprint == fingerprint:
+                            continue # Unchanged since the last scan
+                        # mtimes change without the content changing (copies, restores,
+                        # touch), so only a new size or content fingerprint is announced.
+                        # Hashed before copying, so a read error leaves the entry as it was.
+                        # Without listeners the hash is skipped and any change counts.
+                        content_fp = _content_fingerprint(entry.path, size_bytes) if track_changes else None
+                        existing = snapshot[file_path_str] = copy.copy(existing)
+                        existing.fingerprint = fingerprint
+                        content_changed = (content_fp is None or existing.size != size_bytes or
+                                           existing.content_fp != content_fp)
+                        # Existing entry: Update only size and modified time
+                        existing.size = size_bytes
+                        existing.last_modified = last_modified
+                        existing.content_fp = content_fp
+                        if content_changed:
+                            updated_existing = True # Mark change for signal emission
+                            logging.debug(f"Updated metadata for existing cache: {entry.name}")
                         else:
-                            # New entry: Add to temporary dict using doc_registry lookup
-                            doc_id = item.stem
-                            doc_info_from_registry = doc_registry.get(doc_id, {}) # Get info dict or empty dict
-
-                            original_doc_path = doc_info_from_registry.get('original_file_path', 'Unknown')
-                            token_count = doc_info_from_registry.get('token_count', 0)
-                            context_size = doc_info_from_registry.get('context_size', 0)
-                            model_id = doc_info_from_registry.get('model_id', '') # Load model_id
-                            is_master = doc_info_from_registry.get('is_master', False) # Load master status
-
-                            new_entries[file_path_str] = {
-                                'path': file_path_str,
-                                'filename': item.name,
-                                'size': size_bytes,
-                                'last_modified': last_modified,
-                                'document_id': doc_id,
-                                'original_document': original_doc_path,
-                                'token_count': token_count,   # Store from registry
-                                'context_size': context_size, # Store from registry
-                                'model_id': model_id,         # Store from registry
-                                'is_master': is_master        # Store from registry
-                            }
-                            logging.debug(f"Found new cache file to add (from scan): {item.name}")
-
-                    except OSError as e:
-                        logging.warning(f"Could not stat cache file {item}: {e}")
-                    except Exception as e:
-                        logging.error(f"Unexpected error processing cache file {item}: {e}")
-
-            # Add newly found entries
-            added_new = bool(new_entries)
-            self._cache_registry.update(new_entries)
-
-            # Remove entries for files that no longer exist
-            removed_paths = set(self._cache_registry.keys()) - found_paths
-            removed_any = bool(removed_paths)
-            if removed_any:
-                for path_to_remove in removed_paths:
-                    logging.info(f"Removing missing cache file from registry: {Path(path_to_remove).name}")
-                    del self._cache_registry[path_to_remove]
+                            logging.debug(f"Cache file touched but content unchanged: {entry.name}")
+                    else:
+                        # New entry: Add to the snapshot using doc_registry lookup
+                        doc_id = entry.name[:-len(CACHE_FILE_SUFFIX)]
+                        doc_info_from_registry = doc_registry.get(doc_id, {}) # Get info dict or empty dict
+
+                        original_doc_path = doc_info_from_registry.get('original_file_path', 'Unknown')
+                        token_count = doc_info_from_registry.get('token_count', 0)
+                        context_size = doc_info_from_registry.get('context_size', 0)
+                        model_id = doc_info_from_registry.get('model_id', '') # Load model_id
+                        is_master = doc_info_from_registry.get('is_master', False) # Load master status
+
+                        snapshot[file_path_str] = CacheEntry(
+                            path=file_path_str,
+                            filename=entry.name,
+                            size=size_bytes,
+                            last_modified=last_modified,
+                            document_id=doc_id,
+                            original_document=original_doc_path,
+                            token_count=token_count,   # Store from registry
+                            context_size=context_size, # Store from registry
+                            model_id=model_id,         # Store from registry
+                            is_master=is_master,       # Store from registry
+                            fingerprint=fingerprint
+                        )
+                        added_new = True
+                        logging.debug(f"Found new cache file to add (from scan): {entry.name}")
+
+                except OSError as e:
+                    logging.warning(f"Could not stat cache file {entry.path}: {e}")
+                except Exception as e:
+                    logging.error(f"Unexpected error processing cache file {entry.path}: {e}")
+
+            # Entries for files that no longer exist are left out of the snapshot
+            # Set difference straight on the keys view, without copying the keys into a set first
+            removed_paths = prior.keys() - found_paths
+            for path_to_remove in removed_paths:
+                logging.info(f"Removing missing cache file from registry: {Path(path_to_remove).name}")
+
+            result.update(
+                registry=snapshot,
+                found_paths=found_paths,
+                total_size=sum(cache_entry.size for cache_entry in snapshot.values()),
+                added_new=added_new,
+                removed_any=bool(removed_paths),
+                updated_existing=updated_existing,
+            )
+        except Exception as e:
+            result['error'] = e
+        return result
 
-            # Update last scan results
-            self._last_scan_results = found_paths
+    @pyqtSlot(object)
+    def _apply_scan(self, result: Dict):
+        """Install the registry built by _scan_to_snapshot() and announce changes."""
+        self._scan_in_flight = False
+        self._scan_task = None
 
-            # Emit signal only if entries were added or removed
-            if added_new or removed_any:
+        if result['error'] is not None:
+            logging.error(f"Failed to scan cache directory {result['cache_dir']}: {result['error']}")
+            # Decide if we should clear the registry or leave it stale
+            # self._cache_registry = {}
+            # self._last_scan_results = set()
+            # self.cache_list_updated.emit() # Emit on error?
+        elif result['cache_dir'] != self.kv_cache_dir:
+            logging.debug("Discarding scan of a previous cache directory.")
+        elif result['generation'] != self._registry_generation:
+            # Caches were registered or purged while scanning, scan again from the current registry
+            self._rescan_requested = True
+            self._rescan_force = True
+        else:
+            self._cache_registry = result['registry']
+            self._total_size_bytes = result['total_size']
+
+            # Update last scan results
+            self._last_scan_results = result['found_paths']
+            self._last_scan_dir_mtime = result['dir_mtime']
+            self._schedule_registry_save() # Record the new directory mtime even if nothing changed
+
+            # Emit signal if entries were added, removed or changed. Listeners are
+            # checked now rather than when the scan started, so one connected
+            # meanwhile still hears about the changes
+            if not (self._listeners or self.receivers(self.cache_list_updated) > 0):
+                logging.info(f"Cache list scanned: {len(self._cache_registry)} entries total.")
+            elif result['added_new'] or result['removed_any']:
                 logging.info(f"Cache list updated: {len(self._cache_registry)} entries total.")
-                self.cache_list_updated.emit()
-            elif updated_existing:
+                self._emit_cache_list_updated()
+            elif result['updated_existing']:
                  logging.info("Cache metadata updated, but list structure unchanged.")
-                 # Optionally emit signal even if only metadata changed, if UI needs it
-                 # self.cache_list_updated.emit()
+                 self._emit_cache_list_updated() # Sizes/dates shown in the UI changed
             else:
                  logging.info("Cache list scan found no changes.")
 
-        except Exception as e:
-            logging.error(f"Failed to scan cache directory {self.kv_cache_dir}: {e}")
-            # Decide if we should clear the registry or leave it stale
-            # self._cache_registry = {}
-            # self._last_scan_results = set()
-            # self.cache_list_updated.emit() # Emit on error?
+        if self._rescan_requested:
+            force, self._rescan_requested, self._rescan_force = self._rescan_force, False, False
+            self.refresh_cache_list(scan_now=True, force=force)
 
     def get_cache_list(self) -> List[Dict]:
         """Returns a list of dictionaries, each describing a cache file."""
         # Return values from the registry
-        return list(self._cache_registry.values())
+        return [entry.to_dict() for entry in self._cache_registry.values()]
 
     def get_cache_info(self, cache_path: str) -> Optional[Dict]:
         """Get information about a specific cache file."""
-        return self._cache_registry.get(str(Path(cache_path).resolve()))
+        entry = self._cache_registry.get(self._resolve_key(cache_path))
+        return entry.to_dict() if entry is not None else None
 
     def register_cache(self, document_id, cache_path, context_size,
                       token_count=0, original_file_path="", model_id="",
@@ -172,8 +749,8 @@ class CacheManager(QObject):
         Explicitly register or update a cache file in the registry.
         This is typically called by DocumentProcessor after creating a cache.
         """
-        cache_path_obj = Path(cache_path).resolve()
-        cache_path_str = str(cache_path_obj)
+        cache_path_str = self._resolve_key(cache_path)
+        cache_path_obj = Path(cache_path_str)
         logging.info(f"Registering cache: {document_id} at {cache_path_str}")
 
         if not cache_path_obj.exists():
@@ -184,31 +761,37 @@ class CacheManager(QObject):
 
         try:
             stat_result = cache_path_obj.stat()
-            new_info = {
-                'path': cache_path_str,
-                'filename': cache_path_obj.name,
-                'size': stat_result.st_size,
-                'last_modified': stat_result.st_mtime,
-                'document_id': document_id,
-                'original_document': original_file_path,
-                'context_size': context_size, # Store context size if provided
-                'token_count': token_count,   # Store token count if provided
-                'model_id': model_id,         # Store model id if provided
-                'is_master': is_master        # Store master status
-            }
+            new_entry = CacheEntry(
+                path=cache_path_str,
+                filename=cache_path_obj.name,
+                size=stat_result.st_size,
+                last_modified=stat_result.st_mtime,
+                document_id=document_id,
+                original_document=original_file_path,
+                context_size=context_size, # Store context size if provided
+                token_count=token_count,   # Store token count if provided
+                model_id=model_id,         # Store model id if provided
+                is_master=is_master,       # Store master status
+                fingerprint=[stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns]
+            )
 
             # Check if registry needs updating
             needs_update = True
-            if cache_path_str in self._cache_registry:
+            old_entry = self._cache_registry.get(cache_path_str)
+            if old_entry is not None:
                  # Simple check: if size changed, assume update needed
-                 if self._cache_registry[cache_path_str].get('size') == new_info['size']:
+                 if old_entry.size == new_entry.size:
                      needs_update = False # Avoid unnecessary signal if only metadata changed
+                 self._total_size_bytes -= old_entry.size
 
-            self._cache_registry[cache_path_str] = new_info
+            self._total_size_bytes += new_entry.size
+            self._cache_registry[cache_path_str] = new_entry
+            self._registry_generation += 1
             self._last_scan_results.add(cache_path_str) # Ensure it's in the scan results
+            self._schedule_registry_save()
 
             if needs_update:
-                self.cache_list_updated.emit() # Emit signal as cache was added/updated
+                self._emit_cache_list_updated() # Emit signal as cache was added/updated
 
             return True
         except Exception as e:
@@ -219,7 +802,7 @@ class CacheManager(QObject):
         """Updates usage timestamp for a given cache path (Not fully implemented)."""
         # In a real implementation, you might update 'last_used' or 'usage_count'
         # in the registry and potentially save it.
-        cache_path_str = str(Path(cache_path).resolve())
+        cache_path_str = self._resolve_key(cache_path)
         if cache_path_str in self._cache_registry:
              # self._cache_registry[cache_path_str]['last_used'] = time.time()
              # self._cache_registry[cache_path_str]['usage_count'] = self._cache_registry[cache_path_str].get('usage_count', 0) + 1
@@ -229,27 +812,28 @@ class CacheManager(QObject):
 
     def purge_cache(self, cache_path: str) -> bool:
         """Deletes a cache file and removes it from the registry."""
-        cache_path_obj = Path(cache_path).resolve()
-        cache_path_str = str(cache_path_obj)
+        cache_path_str = self._resolve_key(cache_path)
         logging.info(f"Attempting to purge cache: {cache_path_str}")
-        success = False
         try:
-            if cache_path_obj.exists():
-                cache_path_obj.unlink() # Use unlink for Path objects
+            # Unlink directly instead of checking exists() first: one syscall, no race
+            try:
+                os.unlink(cache_path_str)
                 logging.info(f"Successfully deleted cache file: {cache_path_str}")
-                success = True
-            else:
+            except FileNotFoundError:
                 logging.warning(f"Cache file not found for purging: {cache_path_str}")
-                success = True # Consider it success if file is already gone
+                # Consider it success if file is already gone
 
             # Remove from registry and scan results
             if cache_path_str in self._cache_registry:
-                del self._cache_registry[cache_path_str]
+                self._total_size_bytes -= self._cache_registry.pop(cache_path_str).size
+                self._registry_generation += 1
             if cache_path_str in self._last_scan_results:
                 self._last_scan_results.remove(cache_path_str)
+            self._resolved_cache.pop(str(cache_path), None)
+            self._schedule_registry_save()
 
             self.cache_purged.emit(cache_path_str, True)
-            self.cache_list_updated.emit() # List has changed
+            self._emit_cache_list_updated() # List has changed
             return True
 
         except Exception as e:
@@ -266,21 +850,60 @@ class CacheManager(QObject):
             return False
             
         # Create a list of paths to avoid modifying the iterator during deletion
-        caches_to_purge = list(self.kv_cache_dir.glob('*.llama_cache'))
-        
-        for cache_path_obj in caches_to_purge:
-            if not self.purge_cache(str(cache_path_obj)):
-                 all_purged = False # Keep track if any individual purge fails
+        try:
+            with os.scandir(self.kv_cache_dir) as entries:
+                caches_to_purge = [entry.path for entry in entries
+                                   if entry.name.endswith(CACHE_FILE_SUFFIX) and entry.is_file()]
+        except OSError as e:
+            logging.error(f"Failed to list cache directory {self.kv_cache_dir}: {e}")
+            self.cache_purged.emit(str(self.kv_cache_dir), False)
+            return False
 
-        # Final update after purging
-        self.refresh_cache_list(scan_now=False) # Update internal state
-        self.cache_list_updated.emit() # Emit signal once after all purging
+        def unlink_one(path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass # Already gone counts as purged
+            except OSError as e:
+                return e
+            return None
+
+        # Only the unlinks run on the pool, the registry is updated here afterwards
+        with ThreadPoolExecutor(max_workers=_IO_WORKERS) as pool:
+            errors = list(pool.map(unlink_one, caches_to_purge))
+
+        with self._batched_updates():
+            for path, error in zip(caches_to_purge, errors):
+                if error is not None:
+                    logging.error(f"Failed to purge cache {path}: {error}")
+                    all_purged = False # Keep track if any individual purge fails
+                    self.cache_purged.emit(self._resolve_key(path), False)
+                    continue
+                cache_path_str = self._resolve_key(path)
+                purged_entry = self._cache_registry.pop(cache_path_str, None)
+                if purged_entry is not None:
+                    self._total_size_bytes -= purged_entry.size
+                    self._registry_generation += 1
+                self._last_scan_results.discard(cache_path_str)
+                self._resolved_cache.pop(path, None)
+                self.cache_purged.emit(cache_path_str, True) # Per file, as purge_cache does
+
+            # Final update after purging
+            self.refresh_cache_list(scan_now=False) # Update internal state
+            self._emit_cache_list_updated() # Emit signal once after all purging
+        self._schedule_registry_save()
         logging.info("Finished purging all caches.")
         return all_purged
 
     def get_total_cache_size(self) -> int:
-        """Calculates the total size of all managed cache files."""
-        return sum(info.get('size', 0) for info in self._cache_registry.values())
+        """Returns the total size of all managed cache files."""
+        # Cross-check the running total when debug logging is on
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            actual = sum(entry.size for entry in self._cache_registry.values())
+            if actual != self._total_size_bytes:
+                logging.warning(f"Cache size total drifted: tracked {self._total_size_bytes}, actual {actual}")
+                self._total_size_bytes = actual
+        return self._total_size_bytes
 
     def check_cache_compatibility(self, model_context_size):
         """Checks cache files for compatibility (placeholder)."""
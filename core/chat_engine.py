@@ -8,20 +8,129 @@ Includes implementation for true KV cache loading and fallback.
 
 import os
 import sys
-import tempfile
+import gc
+import codecs
+import mmap
 import logging
 # import shutil # No longer needed?
 import json
 import time
+import queue
 import threading
-import re
-import pickle # Import pickle
 import threading # Added for locking and background tasks
+import itertools
+from collections import OrderedDict, deque
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+import numpy as np
 from PyQt5.QtCore import QObject, pyqtSignal, QCoreApplication
 from llama_cpp import Llama, LlamaCache
+
+from core.cache_manager import load_state_fast
+
+# True on a free-threaded (PEP 703) CPython build running without the GIL, where
+# the UI thread and the inference worker really run Python code in parallel
+_NOGIL = hasattr(sys, '_is_gil_enabled') and not sys._is_gil_enabled()
+
+# Try to import orjson for faster chat history (de)serialization if available
+try:
+    import orjson
+    HAVE_ORJSON = True
+except ImportError:
+    HAVE_ORJSON = False
+
+# Number of loaded KV cache states kept in memory (each can be hundreds of MB)
+STATE_CACHE_SIZE = 2
+
+# Memory budget for prefix state snapshots (see _load_prefixed_state), in MB;
+# overridable with the PREFIX_STATE_CACHE_MB config key. Each snapshot is a full
+# save_state() copy of the KV memory, held in RAM on top of the model's own KV
+# cache, and can reach several GB with large contexts. A snapshot larger than the
+# budget isn't kept; 0 disables snapshots.
+DEFAULT_PREFIX_STATE_CACHE_MB = 1024
+
+
+def _state_nbytes(state: Any) -> int:
+    """Approximate memory held by a LlamaState: the KV blob, logits and token ids."""
+    nbytes = getattr(state, 'llama_state_size', 0) or 0
+    for name in ('scores', 'input_ids'):
+        nbytes += getattr(getattr(state, name, None), 'nbytes', 0)
+    return nbytes
+
+# Prompt structure around the user's question when answering from a loaded KV cache.
+# The prefix adds an explicit instruction to use only the loaded context; the
+# suffix helps prompt the answer.
+KV_PROMPT_PREFIX = "\n\nBased *only* on the loaded document context, answer the following question:\nQuestion: "
+KV_PROMPT_SUFFIX = "\n\nAnswer: "
+
+# Messages kept in the in-memory chat history (older ones are dropped);
+# overridable with the HISTORY_MAX_TURNS config key
+HISTORY_MAXLEN = 32
+# Bytes read per step when loading the last messages of a JSONL history log
+HISTORY_TAIL_CHUNK = 64 * 1024
+# Previous messages the fallback includes in the chat prompt
+FALLBACK_HISTORY_LIMIT = 4
+
+# Streamed text is emitted to the UI at most this many times per second
+# (overridable with the STREAM_HZ config key)
+DEFAULT_STREAM_HZ = 30
+# The fallback stream also flushes once this many characters have built up
+STREAM_FLUSH_CHARS = 64
+
+# Bytes of the original document prepended to the system prompt by the fallback
+FALLBACK_CONTEXT_BYTES = 8000
+
+# Fallback system prompts, without and with a snippet of the original document
+FALLBACK_SYSTEM_PROMPT = "You are a helpful assistant."
+FALLBACK_CONTEXT_PROMPT = (
+    "Use the following text snippet to answer the user's question:\n"
+    "--- TEXT SNIPPET START ---\n{snippet}...\n--- TEXT SNIPPET END ---\n\n"
+    "Answer based *only* on the text snippet provided."
+)
+
+# Seconds a cache file existence check is reused before the file is stat'ed again
+PATH_EXISTS_TTL = 5.0
+
+
+def _read_document_snippet(path: Union[str, Path], max_bytes: int = FALLBACK_CONTEXT_BYTES) -> str:
+    """Decode at most max_bytes from the start of a document without reading the rest."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0: # mmap can't map empty files
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            raw = mm[:max_bytes]
+    return raw.decode('utf-8', errors='replace')
+
+
+def _dump_json_line(obj: Any) -> bytes:
+    """Encode obj as one line of JSONL."""
+    if HAVE_ORJSON:
+        return orjson.dumps(obj) + b"\n"
+    return json.dumps(obj).encode('utf-8') + b"\n"
+
+
+def _read_jsonl_tail(path: Union[str, Path], max_lines: int) -> List[Any]:
+    """
+    Parse the last max_lines records of a JSONL file, reading backwards in
+    HISTORY_TAIL_CHUNK steps so earlier records are never read.
+    """
+    loads = orjson.loads if HAVE_ORJSON else json.loads
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        data = b""
+        # One more newline than records wanted, so the first line kept is complete
+        while pos > 0 and data.count(b"\n") <= max_lines:
+            step = min(HISTORY_TAIL_CHUNK, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.splitlines()
+    if pos > 0:
+        lines = lines[1:] # Partial line cut by the chunk boundary
+    return [loads(line) for line in lines[-max_lines:] if line.strip()] if max_lines > 0 else []
+
+
 class ChatEngine(QObject):
     """Chat functionality using large context window models with KV caches"""
 
@@ -46,12 +155,29 @@ class ChatEngine(QObject):
         self.model_manager = model_manager
         self.cache_manager = cache_manager
 
-        # Chat history
-        self.history = []
+        # Chat history, bounded so long sessions don't grow without limit
+        self._history_maxlen = self._get_history_maxlen()
+        self.history: deque = deque(maxlen=self._history_maxlen)
+        # The UI thread adds user messages while the worker adds replies and reads
+        # recent messages for the fallback prompt
+        self._history_lock = threading.Lock()
+        # Optional append-only JSONL log of every message (HISTORY_JSONL config
+        # key), opened on first write
+        self._history_log = None
+        self._history_log_path: Optional[str] = None
+        self._history_log_lock = threading.Lock()
 
         # Current KV cache selection
         self.current_kv_cache_path = None # Store the path of the *selected* cache
         self.use_kv_cache = True # Whether the user wants to use *a* cache
+        # path -> (monotonic time checked, exists), see _exists_cached
+        self._path_exists_cache: Dict[str, Tuple[float, bool]] = {}
+        # Config model path -> resolved absolute path, see _resolve_model_path
+        self._resolved_model_paths: Dict[str, str] = {}
+        # MASTER_KV_CACHE_PATH config value and its expanded form; other components
+        # update the config in place, so the value is compared on each use
+        self._master_cache_raw: Optional[str] = None
+        self._master_cache_path: Optional[str] = None
 
         # Persistent model instance for warm-up
         self.persistent_llm: Optional[Llama] = None
@@ -59,17 +185,199 @@ class ChatEngine(QObject):
         self.warmed_cache_path: Optional[str] = None # Cache loaded in persistent_llm
         self._lock = threading.Lock() # Protect access to persistent_llm and related state
 
+        # Model instances for non-warmed inference, reused across messages.
+        # Keyed by (model_path, n_ctx, n_threads, n_batch, n_gpu_layers).
+        self._llm_cache: Dict[tuple, Llama] = {}
+        self._llm_cache_lock = threading.Lock()
+
+        # Tokenized KV_PROMPT_PREFIX/KV_PROMPT_SUFFIX per model path, cleared on model load
+        self._prompt_tokens: Dict[str, Tuple[List[int], List[int]]] = {}
+
+        # Loaded KV cache states, keyed by (path, mtime_ns, size), oldest first
+        self._state_cache: "OrderedDict[tuple, Any]" = OrderedDict()
+        # Snapshots of cache states with KV_PROMPT_PREFIX already evaluated, keyed
+        # by (path, mtime_ns, size, model_path, prefix text), oldest first
+        self._prefix_state_cache: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._prefix_state_bytes = 0 # Total _state_nbytes() of _prefix_state_cache
+        self._prefix_state_budget = self._get_prefix_state_budget()
+        self._state_cache_lock = threading.Lock()
+        # (id of cached model instance, prefix state key, n_tokens) for the prefix
+        # state still held in that instance's KV memory, or None
+        self._resident_prefix: Optional[Tuple[int, tuple, int]] = None
+
+        # Single long-lived worker that runs warm-up, unload and inference jobs in
+        # order, so model instances are always used from the same thread
+        self._job_queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._worker_loop, name="ChatEngineWorker", daemon=True)
+        self._worker.start()
+        # Bumped by cancel(); inference jobs queued or running under an older
+        # value stop (or are skipped) at the next token
+        self._cancel_epoch = 0
+        self._active_epoch = 0
+        # Hashes of normalized messages queued or being answered, so a repeated
+        # send of the same message isn't answered twice
+        self._pending_messages: set = set()
+
         # Config setting for true KV cache logic
         self.use_true_kv_cache_logic = self.config.get('USE_TRUE_KV_CACHE', True)
+        self._stream_interval = self._get_stream_interval()
         logging.info(f"ChatEngine initialized. True KV Cache Logic: {self.use_true_kv_cache_logic}")
+        if _NOGIL:
+            logging.info("Running on free-threaded Python; UI and inference threads run in parallel.")
 
 
+    def _get_stream_interval(self) -> float:
+        """Seconds between streamed UI updates, from the STREAM_HZ config value."""
+        try:
+            stream_hz = float(self.config.get('STREAM_HZ', DEFAULT_STREAM_HZ))
+        except (TypeError, ValueError):
+            stream_hz = DEFAULT_STREAM_HZ
+        return 1.0 / stream_hz if stream_hz > 0 else 0.0
+
+    def _get_history_maxlen(self) -> int:
+        """Messages kept in memory, from the HISTORY_MAX_TURNS config value."""
+        try:
+            return max(1, int(self.config.get('HISTORY_MAX_TURNS', HISTORY_MAXLEN)))
+        except (TypeError, ValueError):
+            return HISTORY_MAXLEN
+
+    def _append_history(self, role: str, content: str):
+        """Add a message to the history and append it to the JSONL log, if one is configured."""
+        turn = {"role": role, "content": content}
+        with self._history_lock:
+            self.history.append(turn)
+        log_path = self.config.get('HISTORY_JSONL')
+        if not log_path:
+            return
+        with self._history_log_lock:
+            try:
+                if self._history_log is None or self._history_log_path != log_path:
+                    self._close_history_log()
+                    self._history_log = open(os.path.expanduser(log_path), 'ab')
+                    self._history_log_path = log_path
+                self._history_log.write(_dump_json_line(turn))
+                self._history_log.flush()
+            except OSError as e:
+                logging.error(f"Failed to append to chat history log {log_path}: {e}")
+
+    def _close_history_log(self):
+        """Close the JSONL history log if it is open. Callers hold _history_log_lock."""
+        if self._history_log is not None:
+            try:
+                self._history_log.close()
+            except OSError:
+                pass
+            self._history_log = None
+            self._history_log_path = None
+
+    def _get_prefix_state_budget(self) -> int:
+        """Bytes of prefix state snapshots to keep, from the PREFIX_STATE_CACHE_MB config value."""
+        try:
+            budget_mb = float(self.config.get('PREFIX_STATE_CACHE_MB', DEFAULT_PREFIX_STATE_CACHE_MB))
+        except (TypeError, ValueError):
+            budget_mb = DEFAULT_PREFIX_STATE_CACHE_MB
+        return max(0, int(budget_mb * 1024 * 1024))
+
+    def _store_prefix_state(self, key: tuple, prefix_state: Any):
+        """Add a prefix snapshot, evicting the oldest until the total fits the byte budget."""
+        nbytes = _state_nbytes(prefix_state)
+        with self._state_cache_lock:
+            if nbytes > self._prefix_state_budget:
+                logging.info("Prefix state snapshot (%d MB) exceeds the cache budget; not keeping it.", nbytes >> 20)
+                return
+            old_state = self._prefix_state_cache.pop(key, None)
+            if old_state is not None:
+                self._prefix_state_bytes -= _state_nbytes(old_state)
+            self._prefix_state_cache[key] = prefix_state
+            self._prefix_state_bytes += nbytes
+            while self._prefix_state_bytes > self._prefix_state_budget:
+                _, evicted = self._prefix_state_cache.popitem(last=False)
+                self._prefix_state_bytes -= _state_nbytes(evicted)
+
+    # --- Worker thread ---
+    def _worker_loop(self):
+        """Run queued (function, args) jobs until the None sentinel is received."""
+        while True:
+            job = self._job_queue.get()
+            if job is None:
+                break
+            func, args = job
+            try:
+                func(*args)
+            except Exception as e:
+                logging.exception(f"Unhandled error in chat engine worker: {e}")
+
+    def _submit(self, func, *args):
+        """Queue a job for the worker thread."""
+        self._job_queue.put((func, args))
+
+    def _run_inference(self, epoch: int, message_hash: int, func, *args):
+        """Run an inference job on the worker unless it was cancelled while queued."""
+        try:
+            if epoch != self._cancel_epoch:
+                logging.info("Skipping cancelled inference request.")
+                self.response_complete.emit("", False)
+                return
+            self._active_epoch = epoch
+            func(*args)
+        finally:
+            self._pending_messages.discard(message_hash)
+
+    def _is_cancelled(self) -> bool:
+        """Whether cancel() was called since the running inference job started."""
+        return self._cancel_epoch != self._active_epoch
+
+    def cancel(self):
+        """Stop the running response and drop queued messages. Text generated so far is kept."""
+        self._cancel_epoch += 1
+        logging.info("Inference cancellation requested.")
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """Stop the worker thread, cancelling the running response and queued messages first."""
+        self.cancel()
+        self._job_queue.put(None)
+        self._worker.join(timeout)
+        with self._history_log_lock:
+            self._close_history_log()
+
+    def _exists_cached(self, path: str, ttl: float = PATH_EXISTS_TTL) -> bool:
+        """os.path.exists(path), reusing the result of a check made within ttl seconds."""
+        now = time.monotonic()
+        cached = self._path_exists_cache.get(path)
+        if cached is not None and now - cached[0] < ttl:
+            return cached[1]
+        exists = os.path.exists(path)
+        self._path_exists_cache[path] = (now, exists)
+        return exists
+
+    def _resolve_model_path(self, path: str) -> Optional[str]:
+        """Absolute path of a model file, or None if it doesn't exist. Resolved once per path."""
+        resolved = self._resolved_model_paths.get(path)
+        if resolved is not None and self._exists_cached(resolved):
+            return resolved
+        try:
+            resolved = str(Path(path).resolve(strict=True))
+        except OSError:
+            self._resolved_model_paths.pop(path, None)
+            return None
+        self._resolved_model_paths[path] = resolved
+        return resolved
+
+    def _get_master_cache_path(self) -> Optional[str]:
+        """The master KV cache path from the config, expanded only when the setting changes."""
+        raw = self.config.get('MASTER_KV_CACHE_PATH')
+        if raw != self._master_cache_raw:
+            self._master_cache_raw = raw
+            self._master_cache_path = os.path.expanduser(raw) if raw else None
+        return self._master_cache_path
+
     def set_kv_cache(self, kv_cache_path: Optional[Union[str, Path]]):
         """Set the current KV cache path to use"""
+        self._path_exists_cache.clear()
         if kv_cache_path:
             cache_path = Path(kv_cache_path)
             # Expecting .llama_cache files now
-            if not cache_path.exists() or cache_path.suffix != '.llama_cache':
+            if not self._exists_cached(str(cache_path)) or cache_path.suffix != '.llama_cache':
                 error_msg = f"KV cache not found or invalid: {cache_path}"
                 logging.error(error_msg)
                 self.error_occurred.emit(error_msg)
@@ -108,9 +416,8 @@ class ChatEngine(QObject):
             self.cache_status_changed.emit("Error")
             return
 
-        # Run in background thread
-        thread = threading.Thread(target=self._warm_up_cache_thread, args=(cache_path,), daemon=True)
-        thread.start()
+        # Run on the worker thread
+        self._submit(self._warm_up_cache_thread, cache_path)
 
     def _warm_up_cache_thread(self, cache_path: str):
         """Background thread logic for warming up the cache."""
@@ -161,11 +468,11 @@ class ChatEngine(QObject):
 
                 # Load model if not already loaded
                 if not self.persistent_llm:
+                    self._clear_llm_cache() # Don't keep a second copy of the weights around
+                    self._prompt_tokens.clear()
                     logging.info(f"Loading model for warm-up: {required_model_path}")
                     self.status_updated.emit("Loading model...") # Update main status bar
-                    threads = int(self.config.get('LLAMACPP_THREADS', os.cpu_count() or 4))
-                    batch_size = int(self.config.get('LLAMACPP_BATCH_SIZE', 512))
-                    gpu_layers = int(self.config.get('LLAMACPP_GPU_LAYERS', 0))
+                    threads, batch_size, gpu_layers = self._llama_params()
 
                     self.persistent_llm = Llama(
                         model_path=required_model_path,
@@ -183,8 +490,7 @@ class ChatEngine(QObject):
                 logging.info(f"Loading KV cache state for warm-up: {cache_path}")
                 self.cache_status_changed.emit("Warming Up (Loading State)...")
                 start_time = time.perf_counter()
-                with open(cache_path, 'rb') as f_pickle:
-                    state_data = pickle.load(f_pickle)
+                state_data = self._load_state_data(cache_path)
                 self.persistent_llm.load_state(state_data)
                 load_time = time.perf_counter() - start_time
                 self.warmed_cache_path = cache_path
@@ -211,9 +517,8 @@ class ChatEngine(QObject):
 
     def unload_cache(self):
         """Unloads the persistent model instance and cache state."""
-        # Run in background thread
-        thread = threading.Thread(target=self._unload_cache_thread, daemon=True)
-        thread.start()
+        # Run on the worker thread
+        self._submit(self._unload_cache_thread)
 
     def _unload_cache_thread(self):
         """Background thread logic for unloading the cache."""
@@ -239,9 +544,143 @@ class ChatEngine(QObject):
                  self.cache_status_changed.emit("Error") # Indicate error state
 
 
+    # --- Cached model instances for temporary inference ---
+    def _llama_params(self) -> Tuple[int, int, int]:
+        """Read (n_threads, n_batch, n_gpu_layers) for model loading from the config."""
+        return (int(self.config.get('LLAMACPP_THREADS', os.cpu_count() or 4)),
+                int(self.config.get('LLAMACPP_BATCH_SIZE', 512)),
+                int(self.config.get('LLAMACPP_GPU_LAYERS', 0)))
+
+    def _get_cached_llm(self, abs_model_path: str, context_window: int,
+                        llama_params: Tuple[int, int, int]) -> Llama:
+        """
+        Return a Llama instance for the given model, loading it only if no instance
+        with the same settings is cached. A reused instance is reset before use.
+        Changed thread/batch/GPU settings don't match the cached key, so the model
+        is rebuilt with them instead of silently keeping the old ones.
+        """
+        threads, batch_size, gpu_layers = llama_params
+        key = (abs_model_path, context_window, threads, batch_size, gpu_layers)
+
+        with self._llm_cache_lock:
+            llm = self._llm_cache.get(key)
+            if llm is not None:
+                logging.info("Reusing cached model instance: %s", abs_model_path)
+                llm.reset()
+                return llm
+
+            # Only one cached model at a time; release the old one before loading
+            if self._llm_cache:
+                self._llm_cache.clear()
+                gc.collect()
+            self._prompt_tokens.clear()
+            self._resident_prefix = None
+
+            llm = Llama(
+                model_path=abs_model_path, n_ctx=context_window, n_threads=threads,
+                n_batch=batch_size, n_gpu_layers=gpu_layers, verbose=False
+            )
+            self._llm_cache[key] = llm
+            return llm
+
+    def _clear_llm_cache(self):
+        """Release cached model instances."""
+        with self._llm_cache_lock:
+            if self._llm_cache:
+                logging.info("Releasing cached model instance.")
+                self._llm_cache.clear()
+                gc.collect()
+            self._resident_prefix = None
+
+
+    def _get_prompt_tokens(self, llm: Llama) -> Tuple[List[int], List[int]]:
+        """Return the tokenized KV prompt prefix and suffix for the model, tokenizing once."""
+        tokens = self._prompt_tokens.get(llm.model_path)
+        if tokens is None:
+            tokens = (llm.tokenize(KV_PROMPT_PREFIX.encode('utf-8')),
+                      llm.tokenize(KV_PROMPT_SUFFIX.encode('utf-8'), add_bos=False))
+            self._prompt_tokens[llm.model_path] = tokens
+        return tokens
+
+    def _load_state_data(self, kv_cache_path: str) -> Any:
+        """
+        Return the loaded KV cache state for a cache file. States are memoized
+        by path, modification time and size, so repeated turns against the same
+        cache skip loading the file again.
+        """
+        st = os.stat(kv_cache_path)
+        key = (kv_cache_path, st.st_mtime_ns, st.st_size)
+
+        with self._state_cache_lock:
+            state_data = self._state_cache.get(key)
+            if state_data is not None:
+                self._state_cache.move_to_end(key)
+                logging.info("Using in-memory KV cache state for %s", Path(kv_cache_path).name)
+                return state_data
+
+        state_data = load_state_fast(kv_cache_path)
+
+        with self._state_cache_lock:
+            self._state_cache[key] = state_data
+            while len(self._state_cache) > STATE_CACHE_SIZE:
+                self._state_cache.popitem(last=False)
+        return state_data
+
+
+    def _load_prefixed_state(self, llm: Llama, kv_cache_path: str):
+        """
+        Load the cache state into llm with KV_PROMPT_PREFIX already evaluated.
+        The first time, the prefix is evaluated on top of the cache state and the
+        result is snapshotted with save_state(); later turns load the snapshot and
+        skip evaluating the prefix. When llm still holds that state from the
+        previous turn, it is only rewound to the end of the prefix; the next eval
+        drops the old turn from the KV memory, so nothing is copied or reloaded.
+        """
+        st = os.stat(kv_cache_path)
+        key = (kv_cache_path, st.st_mtime_ns, st.st_size, llm.model_path, KV_PROMPT_PREFIX)
+
+        resident = self._resident_prefix
+        if resident is not None and resident[0] == id(llm) and resident[1] == key:
+            logging.info("Reusing KV cache state already held by the model instance")
+            llm.n_tokens = resident[2]
+            return
+        self._resident_prefix = None
+
+        with self._state_cache_lock:
+            prefix_state = self._prefix_state_cache.get(key)
+            if prefix_state is not None:
+                self._prefix_state_cache.move_to_end(key)
+        if prefix_state is None:
+            state_data = self._load_state_data(kv_cache_path)
+            llm.load_state(state_data)
+            prefix_tokens, _ = self._get_prompt_tokens(llm)
+            llm.eval(prefix_tokens)
+            # save_state() copies the whole KV memory; skip it when the snapshot
+            # couldn't be kept anyway (it is at least as large as the loaded state)
+            budget = self._prefix_state_budget
+            if budget > 0 and _state_nbytes(state_data) <= budget:
+                self._store_prefix_state(key, llm.save_state())
+        else:
+            llm.load_state(prefix_state)
+        self._resident_prefix = (id(llm), key, llm.n_tokens)
+
+
     # --- Send Message Implementation ---
-    def send_message(self, message: str, max_tokens: int = 1024, temperature: float = 0.7):
-        """Send a message to the model and get a response with true KV caching support"""
+    def send_message(self, message: str, max_tokens: int = 1024, temperature: float = 0.7,
+                     top_k: int = 40, top_p: float = 0.95):
+        """
+        Send a message to the model and get a response with true KV caching support.
+        Sampling is restricted to the top_k most likely tokens (and top_p of their
+        probability mass) rather than the whole vocabulary; top_k=0 and top_p=1.0
+        sample from the full distribution with temperature only.
+        """
+        # Ignore a repeat of a message that is still queued or being answered
+        message_hash = hash(message.strip())
+        if message_hash in self._pending_messages:
+            logging.info("Ignoring duplicate message sent while it is still being answered.")
+            self.status_updated.emit("That message is still being answered.")
+            return False
+
         # --- Get Current Model Info (from config, assuming it's the one user intends) ---
         # --- Determine if using persistent warmed-up cache ---
         use_persistent_instance = False
@@ -263,7 +702,7 @@ class ChatEngine(QObject):
                     model_info = self.model_manager.get_model_info(model_id) if model_id else None
                     context_window = model_info.get('context_window', 4096) if model_info else 4096
 
-                logging.info(f"Using persistent warmed-up instance. Model: {model_path}, Cache: {self.warmed_cache_path}")
+                logging.info("Using persistent warmed-up instance. Model: %s, Cache: %s", model_path, self.warmed_cache_path)
             else:
                 # Need to load temporarily or use fallback
                 logging.info("Persistent instance not available or not matching selected cache. Will load temporarily or use fallback.")
@@ -276,9 +715,11 @@ class ChatEngine(QObject):
                 if not model_info:
                     self.error_occurred.emit(f"Model '{model_id}' not found.")
                     return False
-                model_path = model_info.get('path')
-                if not model_path or not Path(model_path).exists():
-                    self.error_occurred.emit(f"Model file not found for '{model_id}': {model_path}")
+                # Resolve here (memoized per path); the worker receives the
+                # absolute path and doesn't stat it again
+                model_path = self._resolve_model_path(model_info['path']) if model_info.get('path') else None
+                if not model_path:
+                    self.error_occurred.emit(f"Model file not found for '{model_id}': {model_info.get('path')}")
                     return False
                 context_window = model_info.get('context_window', 4096)
 
@@ -286,21 +727,21 @@ class ChatEngine(QObject):
         # This might be the warmed path, the selected path (if not warmed), or master path
         actual_kv_cache_path_for_inference = None
         if self.use_kv_cache:
-            if self.current_kv_cache_path and Path(self.current_kv_cache_path).exists():
+            if self.current_kv_cache_path and self._exists_cached(self.current_kv_cache_path):
                  actual_kv_cache_path_for_inference = self.current_kv_cache_path
-                 logging.info(f"Target cache for inference: {actual_kv_cache_path_for_inference}")
+                 logging.info("Target cache for inference: %s", actual_kv_cache_path_for_inference)
             else:
                  # Try master cache if specific one is missing/not selected but toggle is on
-                 master_cache_path_str = self.config.get('MASTER_KV_CACHE_PATH')
-                 if master_cache_path_str and Path(master_cache_path_str).exists():
-                     actual_kv_cache_path_for_inference = str(master_cache_path_str)
-                     logging.info(f"Using master KV cache for inference: {actual_kv_cache_path_for_inference}")
+                 master_cache_path_str = self._get_master_cache_path()
+                 if master_cache_path_str and self._exists_cached(master_cache_path_str):
+                     actual_kv_cache_path_for_inference = master_cache_path_str
+                     logging.info("Using master KV cache for inference: %s", actual_kv_cache_path_for_inference)
                  else:
                      logging.warning("KV cache enabled, but selected cache invalid and master cache invalid/missing.")
                      # Proceed without cache (will use fallback without context prepending)
 
         # Add user message to history (do this *before* starting thread)
-        self.history.append({"role": "user", "content": message})
+        self._append_history("user", message)
 
         # --- Start Inference Thread ---
         target_thread_func = self._inference_thread_fallback # Default to fallback
@@ -316,14 +757,15 @@ class ChatEngine(QObject):
 
         # Pass the determined llm instance if using persistent, otherwise None
         llm_arg = llm_instance_to_use if use_persistent_instance else None
+        # Read model settings here so the worker only receives plain values
+        llama_params = self._llama_params()
 
-        inference_thread = threading.Thread(
-            target=target_thread_func,
-            args=(message, model_path, context_window, actual_kv_cache_path_for_inference, max_tokens, temperature, llm_arg),
-            daemon=True,
-        )
-        inference_thread.start()
-        # Status update will happen inside the thread now
+        self._pending_messages.add(message_hash)
+        self._submit(self._run_inference, self._cancel_epoch, message_hash, target_thread_func,
+                     message, model_path, context_window,
+                     actual_kv_cache_path_for_inference, max_tokens, temperature, top_k, top_p,
+                     llm_arg, llama_params)
+        # Status update will happen inside the worker thread now
 
         return True
 
@@ -331,7 +773,9 @@ class ChatEngine(QObject):
     # --- Inference thread with true KV cache logic ---
     # Modified to accept optional pre-loaded llm instance
     def _inference_thread_with_true_kv_cache(self, message: str, model_path: str, context_window: int,
-                         kv_cache_path: Optional[str], max_tokens: int, temperature: float, llm: Optional[Llama] = None):
+                         kv_cache_path: Optional[str], max_tokens: int, temperature: float,
+                         top_k: int, top_p: float, llm: Optional[Llama] = None,
+                         llama_params: Optional[Tuple[int, int, int]] = None):
         """
         Thread function for model inference using true KV cache loading.
         Can use a pre-loaded persistent llm instance or load temporarily.
@@ -339,122 +783,132 @@ class ChatEngine(QObject):
         is_using_persistent_llm = llm is not None # Check if we received a persistent instance
         temp_llm = None # To hold temporarily loaded instance if needed
         error_message = "" # Initialize error_message
+        prefix_evaluated = False # Whether KV_PROMPT_PREFIX is already in the loaded state
 
         try:
             self.response_started.emit()
             self.status_updated.emit("Processing...") # General status update
 
             if is_using_persistent_llm:
-                logging.info(f"True KV cache thread using PERSISTENT instance. Cache: {kv_cache_path}")
+                logging.info("True KV cache thread using PERSISTENT instance. Cache: %s", kv_cache_path)
                 # llm is already loaded and cache state is assumed to be loaded (by warm_up)
                 self.cache_status_changed.emit("Warmed Up (Generating)") # Update chat tab status
             else:
                 # --- Load Model Temporarily ---
-                logging.info(f"True KV cache thread loading TEMPORARILY. Model: {model_path}, Cache: {kv_cache_path}")
+                logging.info("True KV cache thread loading TEMPORARILY. Model: %s, Cache: %s", model_path, kv_cache_path)
                 self.status_updated.emit("Loading model...")
-                abs_model_path = str(Path(model_path).resolve())
-                if not Path(abs_model_path).exists():
-                    raise FileNotFoundError(f"Model file not found: {abs_model_path}")
-
-                threads = int(self.config.get('LLAMACPP_THREADS', os.cpu_count() or 4))
-                batch_size = int(self.config.get('LLAMACPP_BATCH_SIZE', 512))
-                gpu_layers = int(self.config.get('LLAMACPP_GPU_LAYERS', 0))
-
-                temp_llm = Llama(
-                    model_path=abs_model_path, n_ctx=context_window, n_threads=threads,
-                    n_batch=batch_size, n_gpu_layers=gpu_layers, verbose=False
-                )
+                temp_llm = self._get_cached_llm(model_path, context_window, llama_params or self._llama_params()) # model_path resolved by send_message
                 llm = temp_llm # Use the temporary instance for this inference
-                logging.info("Temporary model loaded.")
+                logging.info("Temporary model ready.")
                 self.status_updated.emit("Loading KV cache state...")
 
                 # --- Load KV Cache Temporarily ---
-                if kv_cache_path and Path(kv_cache_path).exists():
-                    logging.info(f"Loading KV cache state temporarily from: {kv_cache_path}")
+                # Existence was checked by send_message; a file removed since then
+                # fails in the load below and is handled there
+                if kv_cache_path:
+                    logging.info("Loading KV cache state temporarily from: %s", kv_cache_path)
                     # --- Check Cache Compatibility Before Loading Temporarily ---
                     cache_info = self.cache_manager.get_cache_info(kv_cache_path)
                     cache_model_id = cache_info.get('model_id') if cache_info else None
                     current_model_id = self.config.get('CURRENT_MODEL_ID') # Model being loaded temporarily
 
                     if cache_model_id and current_model_id and cache_model_id != current_model_id:
-                        logging.warning(f"Cache '{Path(kv_cache_path).name}' was created with model '{cache_model_id}', but current model is '{current_model_id}'. Skipping temporary load_state.")
+                        logging.warning("Cache '%s' was created with model '%s', but current model is '%s'. Skipping temporary load_state.", Path(kv_cache_path).name, cache_model_id, current_model_id)
                         self.error_occurred.emit(f"Cache incompatible with current model ({current_model_id}).") # Notify user
                         # Proceed without loading state
                     else:
                         # Proceed with loading state if compatible or compatibility unknown
                         try:
-                            with open(kv_cache_path, 'rb') as f_pickle:
-                                state_data = pickle.load(f_pickle)
-                            llm.load_state(state_data)
+                            self._load_prefixed_state(llm, kv_cache_path)
+                            prefix_evaluated = True
                             logging.info("Temporary KV cache state loaded successfully.")
                             self.cache_status_changed.emit("Using TRUE KV Cache") # Update chat tab status
                         except Exception as e_load:
-                            logging.error(f"Error loading temporary KV cache state: {e_load}. Proceeding without cache state.")
+                            logging.error("Error loading temporary KV cache state: %s. Proceeding without cache state.", e_load)
                             # Don't raise, just proceed without the loaded state
+                            llm.reset()
                 else:
                      logging.warning("KV cache path invalid or missing for temporary load. Proceeding without cache state.")
 
+                if not prefix_evaluated:
+                    # This turn is evaluated from position 0 and overwrites the KV
+                    # memory, so the instance no longer holds a loaded prefix state
+                    self._resident_prefix = None
+
             # --- Common Logic: Tokenize, Evaluate, Generate ---
             self.status_updated.emit("Generating response...")
             self.cache_status_changed.emit("Warmed Up (Generating)" if is_using_persistent_llm else "Using TRUE KV Cache (Generating)")
 
             # --- Tokenize user input with structure ---
-            # Add explicit instruction to use only loaded context
-            instruction_prefix = "\n\nBased *only* on the loaded document context, answer the following question:\n"
-            question_prefix = "Question: "
-            suffix_text = "\n\nAnswer: " # Helps prompt the answer
-            full_input_text = instruction_prefix + question_prefix + message + suffix_text
-
-            input_tokens = llm.tokenize(full_input_text.encode('utf-8'))
-            logging.info(f"Tokenized user input with structure ({len(input_tokens)} tokens)")
-
-            # --- Evaluate input tokens to update the loaded KV cache state ---
-            logging.info("Evaluating input tokens...")
-            llm.eval(input_tokens)
-            logging.info("Input tokens evaluated.")
-
-            # --- Generate response using low-level token sampling ---
-            logging.info("Generating response using low-level token sampling")
+            # The constant prefix and suffix are tokenized once per model so only the
+            # message is tokenized per turn; the pieces are joined into one token
+            # list and evaluated in a single call. The prefix is skipped when the
+            # loaded state snapshot already contains it.
+            prefix_tokens, suffix_tokens = self._get_prompt_tokens(llm)
+            message_tokens = llm.tokenize(message.encode('utf-8'), add_bos=False)
+            input_tokens = ([] if prefix_evaluated else prefix_tokens) + message_tokens + suffix_tokens
+            logging.info("Tokenized user input with structure (%d tokens)", len(input_tokens))
+
+            # --- Evaluate input tokens and generate the response ---
+            # generate() evaluates the input on top of the loaded KV cache state and
+            # then keeps sampling/evaluating inside llama-cpp-python. reset=False keeps
+            # the loaded state instead of starting from an empty context.
+            logging.info("Generating response from loaded KV cache state")
             eos_token = llm.token_eos()
-            tokens_generated = []
+            tokens_generated = np.empty(max(max_tokens, 1), dtype=np.intc) # Preallocated token buffer
+            n_tokens = 0 # Tokens stored in tokens_generated
             response_text = ""
-
-            for i in range(max_tokens):
-                # Use sample method
-                # Note: Temperature is not directly used in llm.sample()
-                # It affects the underlying logits before sampling.
-                # If temperature control is needed here, we'd need create_completion or manual logit manipulation.
-                # For now, rely on the model's default sampling or state.
-                token_id = llm.sample()
-
+            last_emitted_len = 0 # Tokens already detokenized and emitted
+            # Holds back the bytes of a UTF-8 character split across detokenized batches
+            utf8_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+            # Bind per-token lookups once, outside the loop
+            detokenize = llm.detokenize
+            decode = utf8_decoder.decode
+            emit_chunk = self.response_chunk.emit
+            is_cancelled = self._is_cancelled
+            monotonic = time.monotonic
+            stream_interval = self._stream_interval
+            next_emit = monotonic() + stream_interval
+
+            token_stream = llm.generate(input_tokens, top_k=top_k, top_p=top_p, temp=temperature, reset=False)
+            for n_generated, token_id in enumerate(token_stream, 1):
                 if token_id == eos_token:
                     logging.info("EOS token encountered.")
                     break
+                if is_cancelled():
+                    logging.info("Generation cancelled.")
+                    break
 
-                tokens_generated.append(token_id)
-                # Evaluate the generated token to update state for the *next* token
-                llm.eval([token_id])
+                tokens_generated[n_tokens] = token_id
+                n_tokens = n_generated
 
-                # Emit chunks periodically for responsiveness
-                if (i + 1) % 8 == 0: # Emit every 8 tokens
-                     current_text = llm.detokenize(tokens_generated).decode('utf-8', errors='replace')
-                     new_text = current_text[len(response_text):]
+                # Emit chunks on a wall-clock cadence, independent of generation speed
+                now = monotonic()
+                if now >= next_emit:
+                     next_emit = now + stream_interval
+                     # Detokenize only the new tokens, not the whole response
+                     new_text = decode(detokenize(tokens_generated[last_emitted_len:n_tokens].tolist()))
+                     last_emitted_len = n_tokens
                      if new_text:
-                         self.response_chunk.emit(new_text)
-                         response_text = current_text
+                         emit_chunk(new_text)
+                         response_text += new_text
                      QCoreApplication.processEvents() # Keep UI responsive
 
+                if n_generated >= max_tokens:
+                    break
+
             # Ensure final text is emitted
-            final_text = llm.detokenize(tokens_generated).decode('utf-8', errors='replace')
-            if len(final_text) > len(response_text):
-                 self.response_chunk.emit(final_text[len(response_text):])
-            response_text = final_text
+            final_text = decode(llm.detokenize(tokens_generated[last_emitted_len:n_tokens].tolist()), final=True)
+            if final_text:
+                 self.response_chunk.emit(final_text)
+                 response_text += final_text
 
-            logging.info(f"Generated response with {len(tokens_generated)} tokens using true KV cache.")
+            logging.info("Generated response with %d tokens using true KV cache.", n_tokens)
 
             # --- Finalize ---
             if response_text.strip():
-                self.history.append({"role": "assistant", "content": response_text})
+                self._append_history("assistant", response_text)
                 self.response_complete.emit(response_text, True)
             else:
                 logging.warning("Model generated an empty response using true KV cache.")
@@ -468,10 +922,8 @@ class ChatEngine(QObject):
             self.response_complete.emit("", False)
             self.cache_status_changed.emit("Error") # Set chat tab status to Error
         finally:
-            # Clean up temporary llm instance if one was created
-            if temp_llm:
-                logging.info("Releasing temporary Llama instance.")
-                temp_llm = None # Allow GC
+            # Drop the local reference; the instance stays in the model cache for reuse
+            temp_llm = None
             # Reset status
             self.status_updated.emit("Idle") # Reset main status bar
             # Reset chat tab status more reliably
@@ -483,7 +935,9 @@ class ChatEngine(QObject):
     # --- Fallback inference method ---
     # Modified to accept optional pre-loaded llm instance (though less likely to be used now)
     def _inference_thread_fallback(self, message: str, model_path: str, context_window: int,
-                        kv_cache_path: Optional[str], max_tokens: int, temperature: float, llm: Optional[Llama] = None):
+                        kv_cache_path: Optional[str], max_tokens: int, temperature: float,
+                        top_k: int, top_p: float, llm: Optional[Llama] = None,
+                        llama_params: Optional[Tuple[int, int, int]] = None):
         """
         Fallback inference method using manual context prepending or no context.
         Can optionally receive a pre-loaded Llama instance (less common now).
@@ -500,24 +954,16 @@ class ChatEngine(QObject):
             if not is_using_persistent_llm:
                 self.status_updated.emit("Fallback: Loading model...")
                 logging.info("Fallback: Loading model temporarily...")
-                abs_model_path = str(Path(model_path).resolve())
-                if not Path(abs_model_path).exists():
-                    raise FileNotFoundError(f"Model file not found: {abs_model_path}")
-                threads = int(self.config.get('LLAMACPP_THREADS', os.cpu_count() or 4))
-                batch_size = int(self.config.get('LLAMACPP_BATCH_SIZE', 512))
-                gpu_layers = int(self.config.get('LLAMACPP_GPU_LAYERS', 0))
-                temp_llm = Llama(
-                    model_path=abs_model_path, n_ctx=context_window, n_threads=threads,
-                    n_batch=batch_size, n_gpu_layers=gpu_layers, verbose=False
-                )
+                temp_llm = self._get_cached_llm(model_path, context_window, llama_params or self._llama_params()) # model_path resolved by send_message
                 llm = temp_llm # Use the temporary instance
-                logging.info("Fallback: Temporary model loaded.")
+                self._resident_prefix = None # The chat completion overwrites the KV memory
+                logging.info("Fallback: Temporary model ready.")
             else:
                  logging.info("Fallback: Using pre-loaded Llama instance.")
 
             # --- Prepare Chat History with Manual Context Prepending (if cache path provided) ---
             chat_messages = []
-            system_prompt_content = "You are a helpful assistant." # Default system prompt
+            system_prompt_content = FALLBACK_SYSTEM_PROMPT # Default system prompt
 
             if kv_cache_path: # Use kv_cache_path to find original doc for prepending
                 logging.info("Fallback: Attempting to prepend original document context.")
@@ -529,25 +975,20 @@ class ChatEngine(QObject):
                     if cache_info and 'original_document' in cache_info:
                         original_doc_path_str = cache_info['original_document']
                         if original_doc_path_str != "Unknown":
-                            original_doc_path = Path(original_doc_path_str)
-                            if original_doc_path.exists():
-                                with open(original_doc_path, 'r', encoding='utf-8', errors='replace') as f_doc:
-                                    doc_context_text = f_doc.read(8000) # Read snippet
-                                logging.info(f"Fallback: Read {len(doc_context_text)} chars for prepending.")
-                            else: logging.warning(f"Fallback: Original doc path not found: {original_doc_path}")
-                        else: logging.warning(f"Fallback: Original doc path is 'Unknown' for cache: {kv_cache_path}")
-                    else: logging.warning(f"Fallback: No cache info or original doc path for cache: {kv_cache_path}")
+                            try:
+                                doc_context_text = _read_document_snippet(original_doc_path_str) # Read snippet
+                                logging.info("Fallback: Read %d chars for prepending.", len(doc_context_text))
+                            except FileNotFoundError:
+                                logging.warning("Fallback: Original doc path not found: %s", original_doc_path_str)
+                        else: logging.warning("Fallback: Original doc path is 'Unknown' for cache: %s", kv_cache_path)
+                    else: logging.warning("Fallback: No cache info or original doc path for cache: %s", kv_cache_path)
 
                     if doc_context_text:
-                         system_prompt_content = (
-                             f"Use the following text snippet to answer the user's question:\n"
-                             f"--- TEXT SNIPPET START ---\n{doc_context_text}...\n--- TEXT SNIPPET END ---\n\n"
-                             f"Answer based *only* on the text snippet provided."
-                         )
+                         system_prompt_content = FALLBACK_CONTEXT_PROMPT.format(snippet=doc_context_text)
                          logging.info("Fallback: Using system prompt with prepended context.")
                     else: logging.warning("Fallback: Failed to read context, using default system prompt.")
                 except Exception as e_ctx:
-                    logging.error(f"Fallback: Error retrieving context: {e_ctx}")
+                    logging.error("Fallback: Error retrieving context: %s", e_ctx)
                     logging.warning("Fallback: Using default system prompt.")
             else:
                  logging.info("Fallback: No cache path provided, using default system prompt without prepending.")
@@ -556,43 +997,61 @@ class ChatEngine(QObject):
             # Add system prompt
             chat_messages.append({"role": "system", "content": system_prompt_content})
             # Add recent history (ensure slicing is correct)
-            history_limit = 4
-            start_index = max(0, len(self.history) - 1 - history_limit) # Index of first message to include
-            recent_history = self.history[start_index:-1] # History *before* the last user message
-            chat_messages.extend(recent_history)
-            # Add latest user message (which is the last one in self.history)
-            chat_messages.append(self.history[-1])
-            logging.info(f"Fallback: Prepared chat history with {len(chat_messages)} messages.")
+            with self._history_lock:
+                start_index = max(0, len(self.history) - 1 - FALLBACK_HISTORY_LIMIT) # Index of first message to include
+                recent_history = itertools.islice(self.history, start_index, len(self.history) - 1) # History *before* the last user message
+                chat_messages.extend(recent_history)
+                # Add latest user message (which is the last one in self.history)
+                chat_messages.append(self.history[-1])
+            logging.info("Fallback: Prepared chat history with %d messages.", len(chat_messages))
 
             # --- Generate Response (Streaming using create_chat_completion) ---
             self.status_updated.emit("Fallback: Generating response...")
-            logging.info(f"Fallback: Generating response using create_chat_completion...")
+            logging.info("Fallback: Generating response using create_chat_completion...")
             stream = llm.create_chat_completion(
                 messages=chat_messages,
                 max_tokens=max_tokens,
                 temperature=temperature,
+                top_k=top_k,
+                top_p=top_p,
                 stream=True
             )
 
-            complete_response = ""
+            # Coalesce stream deltas and emit them at the STREAM_HZ cadence (or once
+            # STREAM_FLUSH_CHARS have built up) to limit signal traffic
+            emit_chunk = self.response_chunk.emit
+            monotonic = time.monotonic
+            stream_interval = self._stream_interval
+            response_parts = []
+            pending_text = ""
+            last_flush = monotonic()
             for chunk in stream:
-                # [Stream handling logic remains the same]
-                # ... (omitted for brevity, assumed unchanged) ...
-                try:
-                    delta = chunk["choices"][0].get("delta", {})
-                    text = delta.get("content")
-                    if text:
-                        self.response_chunk.emit(text)
-                        complete_response += text
-                except (KeyError, IndexError, TypeError) as e:
-                    logging.warning(f"Fallback: Could not extract text from stream chunk: {chunk}, Error: {e}")
+                if self._is_cancelled():
+                    logging.info("Fallback: Generation cancelled.")
+                    break
+                choices = chunk.get("choices")
+                if not choices:
+                    continue
+                text = choices[0].get("delta", {}).get("content")
+                if not text:
+                    continue
+                response_parts.append(text)
+                pending_text += text
+                now = monotonic()
+                if now - last_flush >= stream_interval or len(pending_text) > STREAM_FLUSH_CHARS:
+                    emit_chunk(pending_text)
+                    pending_text = ""
+                    last_flush = now
+            if pending_text:
+                emit_chunk(pending_text)
+            complete_response = "".join(response_parts)
 
 
             logging.info("Fallback: Response generation complete.")
 
             # --- Finalize ---
             if complete_response.strip():
-                self.history.append({"role": "assistant", "content": complete_response})
+                self._append_history("assistant", complete_response)
                 self.response_complete.emit(complete_response, True)
             else:
                 logging.warning("Fallback: Model stream completed but produced no text.")
@@ -606,10 +1065,8 @@ class ChatEngine(QObject):
             self.response_complete.emit("", False)
             self.cache_status_changed.emit("Error") # Set chat tab status to Error
         finally:
-            # Clean up temporary llm instance if one was created
-            if temp_llm:
-                logging.info("Releasing temporary Llama instance from fallback.")
-                temp_llm = None # Allow GC
+            # Drop the local reference; the instance stays in the model cache for reuse
+            temp_llm = None
             # Reset status
             self.status_updated.emit("Idle") # Reset main status bar
             # Reset chat tab status more reliably
@@ -619,24 +1076,31 @@ class ChatEngine(QObject):
 
 
     def clear_history(self):
-        self.history = []
+        with self._history_lock:
+            self.history.clear()
         logging.info("Chat history cleared")
         # Also unload cache if one was warmed up? Optional, maybe keep it warm.
         # self.unload_cache()
 
     def get_history(self) -> List[Dict]:
-        return self.history
+        with self._history_lock:
+            return list(self.history)
 
     def save_history(self, file_path: Union[str, Path]) -> bool:
         try:
-            with open(file_path, 'w') as f:
-                json.dump({
-                    "history": self.history,
-                    "model_id": self.config.get('CURRENT_MODEL_ID'),
-                    "kv_cache_path": self.current_kv_cache_path,
-                    "timestamp": time.time(),
-                    "use_kv_cache_setting": self.use_kv_cache
-                }, f, indent=2)
+            payload = {
+                "history": self.get_history(),
+                "model_id": self.config.get('CURRENT_MODEL_ID'),
+                "kv_cache_path": self.current_kv_cache_path,
+                "timestamp": time.time(),
+                "use_kv_cache_setting": self.use_kv_cache
+            }
+            if HAVE_ORJSON:
+                data = orjson.dumps(payload, option=orjson.OPT_INDENT_2)
+            else:
+                data = json.dumps(payload, indent=2).encode('utf-8')
+            with open(file_path, 'wb') as f:
+                f.write(data)
             logging.info(f"Chat history saved to {file_path}")
             return True
         except Exception as e:
@@ -644,13 +1108,29 @@ class ChatEngine(QObject):
             return False
 
     def load_history(self, file_path: Union[str, Path]) -> bool:
+        """
+        Load a history saved by save_history, or the last messages of a JSONL
+        history log (a .jsonl file), which only restores the messages.
+        """
+        if str(file_path).endswith('.jsonl'):
+            try:
+                history = deque(_read_jsonl_tail(file_path, self._history_maxlen), maxlen=self._history_maxlen)
+                with self._history_lock:
+                    self.history = history
+                logging.info(f"Chat history loaded from log {file_path}")
+                return True
+            except Exception as e:
+                logging.error(f"Failed to load chat history log: {str(e)}")
+                return False
         try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
+            with open(file_path, 'rb') as f:
+                raw = f.read()
+            data = orjson.loads(raw) if HAVE_ORJSON else json.loads(raw)
 
-            self.history = data.get("history", [])
+            with self._history_lock:
+                self.history = deque(data.get("history", []), maxlen=self._history_maxlen)
             kv_cache_path_str = data.get("kv_cache_path")
-            if kv_cache_path_str and Path(kv_cache_path_str).exists() and Path(kv_cache_path_str).suffix == '.llama_cache':
+            if kv_cache_path_str and kv_cache_path_str.endswith('.llama_cache') and self._exists_cached(kv_cache_path_str):
                 self.current_kv_cache_path = kv_cache_path_str
                 logging.info(f"Loaded KV cache path from history: {self.current_kv_cache_path}")
             else:
@@ -665,6 +1145,15 @@ class ChatEngine(QObject):
 
     def update_config(self, config):
         self.config = config
+        self._path_exists_cache.clear()
+        self._resolved_model_paths.clear()
+        history_maxlen = self._get_history_maxlen()
+        if history_maxlen != self._history_maxlen:
+            self._history_maxlen = history_maxlen
+            with self._history_lock:
+                self.history = deque(self.history, maxlen=history_maxlen)
         # Update true KV cache setting if present
         self.use_true_kv_cache_logic = self.config.get('USE_TRUE_KV_CACHE', True) # Keep default True for testing
+        self._stream_interval = self._get_stream_interval()
+        self._prefix_state_budget = self._get_prefix_state_budget()
         logging.info(f"ChatEngine configuration updated. True KV Cache Logic: {self.use_true_kv_cache_logic}")
@@ -14,6 +14,7 @@ import threading
 import json
 import re
 import time
+import inspect
 import pickle # Import pickle
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Union
@@ -24,6 +25,7 @@ from llama_cpp import Llama, LlamaCache
 # Assuming utils.token_counter uses tiktoken or similar for a rough estimate
 # We'll use llama-cpp's tokenizer for the actual processing count
 from utils.token_counter import estimate_tokens
+from core.cache_manager import save_state_fast
 
 
 class DocumentProcessor(QObject):
@@ -34,6 +36,10 @@ class DocumentProcessor(QObject):
     processing_complete = pyqtSignal(str, bool, str)  # document_id, success, message
     token_estimation_complete = pyqtSignal(str, int, bool)  # document_id, tokens, fits_context
 
+    # How the installed llama_cpp's save_state() is called, decided on first save:
+    # 'no_arg' returns a state object, 'path_arg' writes the file itself
+    _save_strategy = None
+
     def __init__(self, config, llama_manager, model_manager, cache_manager):
         """Initialize document processor"""
         super().__init__()
@@ -158,16 +164,37 @@ class DocumentProcessor(QObject):
             self.processing_complete.emit(document_id, False, f"Processing failed: {str(e)}")
             return False
 
+    @classmethod
+    def _pick_save_strategy(cls, llm) -> str:
+        """Inspect llm.save_state once and remember which calling convention it uses"""
+        if cls._save_strategy is None:
+            try:
+                params = inspect.signature(llm.save_state).parameters
+                cls._save_strategy = 'path_arg' if params else 'no_arg'
+            except (ValueError, TypeError):
+                cls._save_strategy = 'no_arg'
+            logging.info(f"Using save_state strategy: {cls._save_strategy}")
+        return cls._save_strategy
+
     def _save_kv_cache_state(self, llm, kv_cache_path: Path) -> bool:
         """
         Improved function to save KV cache state using recommended approach.
         Returns True if successful, False otherwise.
         """
         logging.info(f"Saving KV cache state to {kv_cache_path}...")
+        strategy = self._pick_save_strategy(llm)
+
+        # Method 1: Get the state object without arguments, then write it out
+        if strategy == 'no_arg':
+            return self._save_state_object(llm, kv_cache_path)
 
-        # Method 1: Try getting state without arguments first, then pickle
+        # Method 2: Let save_state write the file from a path argument
+        return self._save_state_to_path(llm, kv_cache_path)
+
+    def _save_state_object(self, llm, kv_cache_path: Path) -> bool:
+        """Save the object returned by llm.save_state() to kv_cache_path"""
         try:
-            logging.info("Using save_state() without arguments and pickling...")
+            logging.info("Using save_state() without arguments...")
             state_data = llm.save_state()  # Get state data object
 
             # Verify we got something valid
@@ -175,15 +202,23 @@ class DocumentProcessor(QObject):
                 logging.error("save_state() returned None")
                 return False
 
-            # Save with pickle
-            with open(kv_cache_path, 'wb') as f_pickle:
-                pickle.dump(state_data, f_pickle)
-            logging.info("KV cache state saved successfully via pickle")
+            # Save as raw arrays that can be memory-mapped on load, pickle if the
+            # state has fields the flat format can't represent
+            try:
+                save_state_fast(state_data, kv_cache_path)
+                logging.info("KV cache state saved successfully")
+            except TypeError as e:
+                logging.warning(f"Falling back to pickle for KV cache state: {e}")
+                with open(kv_cache_path, 'wb') as f_pickle:
+                    pickle.dump(state_data, f_pickle, protocol=pickle.HIGHEST_PROTOCOL)
+                logging.info("KV cache state saved successfully via pickle")
             return True
         except (AttributeError, pickle.PicklingError) as e:
-            logging.error(f"Error in primary KV cache save method: {e}")
+            logging.error(f"Error saving KV cache state object: {e}")
+            return False
 
-        # Method 2: Try direct path argument as fallback
+    def _save_state_to_path(self, llm, kv_cache_path: Path) -> bool:
+        """Have llm.save_state write kv_cache_path itself"""
         try:
             logging.info("Trying save_state with direct path argument...")
             llm.save_state(str(kv_cache_path))
@@ -195,10 +230,7 @@ class DocumentProcessor(QObject):
             else:
                 logging.error("save_state(path) did not create a valid file")
         except Exception as e:
-            logging.error(f"Error in fallback KV cache save method: {e}")
-
-        # If we get here, both methods failed
-        logging.error("All KV cache save methods failed")
+            logging.error(f"Error in path-argument KV cache save method: {e}")
         return False
 
     def _process_document_thread(self, document_id: str, document_path: str, model_path: str,
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Tests for ChatEngine's reuse of the KV cache state held by a cached model instance.
+"""
+
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("llama_cpp")
+
+from core.chat_engine import ChatEngine
+
+
+class FakeState:
+    def __init__(self, n_tokens):
+        self.n_tokens = n_tokens
+
+
+class FakeLlama:
+    """Records state loads; generates one token and then EOS."""
+
+    model_path = "/models/fake.gguf"
+
+    def __init__(self):
+        self.n_tokens = 0
+        self.load_state_calls = 0
+
+    def tokenize(self, text, add_bos=True):
+        return [1] * len(text)
+
+    def eval(self, tokens):
+        self.n_tokens += len(tokens)
+
+    def save_state(self):
+        return FakeState(self.n_tokens)
+
+    def load_state(self, state):
+        self.load_state_calls += 1
+        self.n_tokens = state.n_tokens
+
+    def reset(self):
+        self.n_tokens = 0
+
+    def token_eos(self):
+        return 0
+
+    def detokenize(self, tokens):
+        return b"ok" * len(tokens)
+
+    def generate(self, tokens, **kwargs):
+        self.eval(tokens)
+        yield 5
+        yield 0
+
+
+class FakeCacheManager:
+    def __init__(self):
+        self.model_id = "model-a"
+
+    def get_cache_info(self, path):
+        return {"model_id": self.model_id}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = ChatEngine({"CURRENT_MODEL_ID": "model-a"}, None, None, FakeCacheManager())
+    llm = FakeLlama()
+    engine._get_cached_llm = lambda *args: llm
+    engine._load_state_data = lambda path: FakeState(100)
+    cache_path = tmp_path / "doc.llama_cache"
+    cache_path.write_bytes(b"state")
+    yield engine, llm, str(cache_path)
+    engine.shutdown(timeout=1)
+
+
+def _run_turn(engine, cache_path):
+    engine._inference_thread_with_true_kv_cache(
+        "question", "/models/fake.gguf", 4096, cache_path, 16, 0.0, 40, 0.95, None, (1, 8, 0))
+
+
+def test_resident_state_reused_between_turns(engine):
+    engine, llm, cache_path = engine
+    _run_turn(engine, cache_path)
+    _run_turn(engine, cache_path)
+    # The first turn loads the document state; the second only rewinds to it
+    assert llm.load_state_calls == 1
+
+
+def test_mismatched_model_turn_drops_resident_state(engine):
+    engine, llm, cache_path = engine
+    _run_turn(engine, cache_path)
+    assert engine._resident_prefix is not None
+
+    # A turn that skips loading the cache evaluates over the document state
+    engine.cache_manager.model_id = "model-b"
+    _run_turn(engine, cache_path)
+    assert engine._resident_prefix is None
+
+    # So the next compatible turn has to load the state again
+    engine.cache_manager.model_id = "model-a"
+    loads_before = llm.load_state_calls
+    _run_turn(engine, cache_path)
+    assert llm.load_state_calls == loads_before + 1
+
+
+def test_cancel_skips_queued_inference(engine):
+    engine, llm, cache_path = engine
+    epoch = engine._cancel_epoch
+    engine.cancel()
+    calls = []
+    engine._run_inference(epoch, hash("question"), lambda: calls.append(1))
+    assert calls == []
+
+
+def test_cancel_stops_running_generation(engine):
+    engine, llm, cache_path = engine
+    generated = []
+
+    def endless_generate(tokens, **kwargs):
+        llm.eval(tokens)
+        while True:
+            generated.append(5)
+            if len(generated) == 3:
+                engine.cancel()
+            yield 5
+
+    llm.generate = endless_generate
+    engine._run_inference(engine._cancel_epoch, hash("question"),
+                          engine._inference_thread_with_true_kv_cache,
+                          "question", "/models/fake.gguf", 4096, cache_path, 1000,
+                          0.0, 40, 0.95, None, (1, 8, 0))
+    assert len(generated) == 3
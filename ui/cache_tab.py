@@ -98,7 +98,7 @@ Status Colors (in Chat Tab): Green = TRUE KV Cache, Orange = Fallback/Master, Gr
     def connect_signals(self):
         """Connect signals between components"""
         # Button signals
-        self.refresh_button.clicked.connect(self.refresh_caches)
+        self.refresh_button.clicked.connect(self.scan_caches)
         self.purge_button.clicked.connect(self.purge_selected_cache)
         self.use_button.clicked.connect(self.use_selected_cache)
         self.purge_all_button.clicked.connect(self.confirm_purge_all_caches) # Connect new button
@@ -110,24 +110,26 @@ Status Colors (in Chat Tab): Green = TRUE KV Cache, Orange = Fallback/Master, Gr
         self.cache_manager.cache_list_updated.connect(self.refresh_caches)
         self.cache_manager.cache_purged.connect(self.on_cache_purged)
 
+    def scan_caches(self):
+        """Ask the cache manager to rescan the cache directory"""
+        try:
+            # Forced: a file rewritten in place (or a coarse-mtime filesystem) leaves
+            # the directory mtime unchanged, and the user asked for a rescan
+            self.cache_manager.refresh_cache_list(scan_now=True, force=True)
+        except Exception as e:
+            logging.error(f"Error calling cache_manager.refresh_cache_list: {e}")
+            QMessageBox.warning(self, "Refresh Error", f"Could not refresh cache list: {e}")
+
     def refresh_caches(self):
-        """Refresh the cache list"""
+        """Rebuild the table from the cache manager's current list"""
         logging.debug("CacheTab: Refreshing cache list UI.")
         try:
             # Clear the table
             self.cache_table.setRowCount(0)
 
-            # Ask cache manager to update its internal list (if needed, controlled by scan_now=True)
-            # We call it here to ensure the list is up-to-date before getting it.
-            # The recursion was fixed in CacheManager, so this is safe.
-            try:
-                self.cache_manager.refresh_cache_list(scan_now=True)
-            except Exception as e:
-                logging.error(f"Error calling cache_manager.refresh_cache_list: {e}")
-                QMessageBox.warning(self, "Refresh Error", f"Could not refresh cache list: {e}")
-                # Continue with potentially stale list from manager
-
-            # Get the cache list
+            # Get the cache list. Scans run in the background and end with
+            # cache_list_updated, which is connected to this method, so this is
+            # the latest list rather than one read before a scan finished
             caches = self.cache_manager.get_cache_list()
             logging.debug(f"CacheTab: Received {len(caches)} caches from manager.")
 
@@ -133,6 +133,11 @@ class ChatTab(QWidget):
         self.send_button = QPushButton("Send")
         input_layout.addWidget(self.send_button)
 
+        # Stop button, cancels the response being generated
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setEnabled(False) # Enabled while a response is pending
+        input_layout.addWidget(self.stop_button)
+
         layout.addLayout(input_layout)
 
         # --- Cache Performance Section ---
@@ -155,6 +160,7 @@ class ChatTab(QWidget):
         # Input signals
         self.send_button.clicked.connect(self.send_message)
         self.user_input.returnPressed.connect(self.send_message) # Send on Enter key
+        self.stop_button.clicked.connect(self.on_stop_button_clicked)
 
         # Chat engine signals
         self.chat_engine.response_complete.connect(self.on_response_complete)
@@ -187,21 +193,32 @@ class ChatTab(QWidget):
         if not message:
             return # Don't send empty messages
 
-        # Display user message immediately
+        # Send to chat engine
+        try:
+            if not self.chat_engine.send_message(message):
+                # Not queued (duplicate of a pending message, or an error already
+                # reported by ChatEngine); keep the text in the input
+                return
+        except Exception as e:
+            self.display_error(f"Failed to send message: {e}")
+            return
+
+        # Display user message; the response arrives through queued signals after this
         self.append_message("You", message)
 
         # Clear input field
         self.user_input.clear()
 
-        # Send to chat engine
-        try:
-            self.chat_engine.send_message(message)
-            # Status update is now handled by ChatEngine signal
-            # self.update_status("Sending message...")
-            self.send_button.setEnabled(False) # Disable button while processing
-            # self.user_input.setEnabled(False) # Keep input enabled
-        except Exception as e:
-            self.display_error(f"Failed to send message: {e}")
+        # Status update is now handled by ChatEngine signal
+        # self.update_status("Sending message...")
+        self.send_button.setEnabled(False) # Disable button while processing
+        self.stop_button.setEnabled(True)
+        # self.user_input.setEnabled(False) # Keep input enabled
+
+    def on_stop_button_clicked(self):
+        """Cancel the response being generated; the text so far is kept"""
+        self.chat_engine.cancel()
+        self.stop_button.setEnabled(False)
 
     # Slot for response chunks
     @pyqtSlot(str)
@@ -235,6 +252,7 @@ class ChatTab(QWidget):
             pass # Error already displayed by display_error signal
 
         self.send_button.setEnabled(True) # Re-enable button
+        self.stop_button.setEnabled(False)
         # self.user_input.setEnabled(True) # Keep input enabled
         self.user_input.setFocus() # Set focus back to input
 
@@ -245,6 +263,7 @@ class ChatTab(QWidget):
         # Status is updated by ChatEngine signal ("Error") -> cache_status_changed("Error")
         logging.error(f"Chat Error: {error_message}")
         self.send_button.setEnabled(True) # Re-enable button on error
+        self.stop_button.setEnabled(False)
         self.warmup_button.setEnabled(self._can_warmup()) # Re-evaluate warmup button state
         self.user_input.setFocus()
 
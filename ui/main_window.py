@@ -332,6 +332,9 @@ class MainWindow(QMainWindow):
         
         # Save config
         self.config_manager.save_config()
+
+        # Let the chat engine finish its current job and stop its worker
+        self.chat_engine.shutdown(timeout=5.0)
         
         # Accept event
         event.accept()